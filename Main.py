@@ -1,6 +1,7 @@
 # test2
 
 import asyncio
+import os
 import threading
 from server.upload_server import create_upload_app
 from server.websocket_server import run_ai_server
@@ -9,8 +10,21 @@ def run_flask():
     app = create_upload_app() #locally hosted server 4 anya
     app.run(host="0.0.0.0", port=5000)
 
+async def run_async_servers():
+    # Static/audio files served from the same event loop (needs aiohttp)
+    from server.static_server import start_static_server
+    runner = await start_static_server(port=5000)
+    try:
+        await run_ai_server()
+    finally:
+        await runner.cleanup()
+
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.start()
+    # ANYA_HTTP_SERVER=async serves files with aiohttp (sendfile, Range, ETags) instead of Flask
+    if os.environ.get("ANYA_HTTP_SERVER", "flask") == "async":
+        asyncio.run(run_async_servers())
+    else:
+        flask_thread = threading.Thread(target=run_flask)
+        flask_thread.start()
 
-    asyncio.run(run_ai_server())
+        asyncio.run(run_ai_server())
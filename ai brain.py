@@ -1,28 +1,88 @@
 import asyncio
+import hashlib
 import json
+import logging
+import threading
 import time
-from typing import List, Dict, Optional
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+from typing import AsyncIterator, Deque, List, Dict, Optional
 from dataclasses import dataclass
-from model.model_manager import ModelManager
+from model.model_manager import ModelManager, model_lock
+from model.inference_scheduler import GenerationCancelled, SchedulerBusy
+from model.speculative import get_speculative_decoding
+from server.metrics import generated_tokens, stage_seconds, tokens_per_second
+
+logger = logging.getLogger(__name__)
+
 #0309 #test
-@dataclass
+@dataclass(slots=True)
 class Message:
     role: str  # "user", "assistant", "system"
     content: str
     timestamp: float
+    token_count: int = 0  # Prompt tokens, counted once with the model's tokenizer
+
+# ChatML wraps every message in "<|im_start|>role\n ... <|im_end|>\n"
+MESSAGE_OVERHEAD_TOKENS = 5
+# Rough per-message bookkeeping cost on top of the text, for session memory limits
+MESSAGE_OVERHEAD_BYTES = 64
 
 class AIPersonality:
     """Manages AI personality and conversation state"""
 
-    def __init__(self, model, tokenizer=None, personality_config=None):
+    def __init__(self, model, tokenizer=None, personality_config=None, state_cache=None, session_id=None,
+                 scheduler=None, engine=None, model_manager=None, model_name=None, response_cache=None,
+                 long_term_memory=None, conversation_store=None, summarize=False, summary_model=None,
+                 lora_adapters=None):
         self.model = model
         self.tokenizer = tokenizer
-        self.conversation_history: List[Message] = []
+        self.state_cache = state_cache  # Optional SessionStateCache for KV reuse between turns
+        self.session_id = session_id
+        self.scheduler = scheduler      # Optional InferenceScheduler shared by all sessions
+        self.engine = engine            # Optional BatchedGenerationEngine used instead of the model
+        self.model_manager = model_manager  # Optional ModelManager registry to pick models by name
+        self.model_name = model_name        # Registry model for this session (None = default)
+        self.response_cache = response_cache  # Optional ResponseCache for repeated small talk
+        self.long_term_memory = long_term_memory  # Optional LongTermMemory recalled into prompts
+        self.conversation_store = conversation_store  # Optional ConversationStore persisting every message
+        self.lora_adapters = lora_adapters  # Optional LoRAAdapterManager for personality adapters
+        self.lora_adapter: Optional[str] = None  # Adapter chosen for this session (None = personality default)
+        self.conversation_history: Deque[Message] = deque()
+        self.pinned_messages: List[Message] = []  # System messages outlive trimming
+
+        # Whole-conversation totals, updated as messages come and go instead of rescanning history
+        self.message_counts = {"user": 0, "assistant": 0, "system": 0}
+        self.conversation_start: Optional[float] = None
+        self.last_activity: Optional[float] = None
+        self._history_bytes = 0
+        self._unsaved_user_message: Optional[Message] = None
         self.personality_config = personality_config or self.default_personality()
 
         # Memory management
         self.max_history_length = 20  # Keep last 20 messages
-        self.context_window = 4000    # Model's context limit
+        self.context_window = 4000    # Fallback context limit when the model can't report n_ctx
+        self._system_prompt_tokens = None
+
+        # Rolling summary: older turns are folded into one bounded system message while the session is idle
+        self.summarize = summarize
+        self.summary_model = summary_model  # Registry model for summaries (None = the session's model)
+        self.rolling_summary = ""
+        self.summary_max_tokens = 200
+        self.keep_recent_messages = 8      # Raw messages always kept verbatim
+        self.compact_after_messages = 14   # Fold once the raw history grows past this
+        self.compaction_delay = 2.0        # Seconds of idleness before compacting
+        self._summary_tokens = 0
+        self._trimmed_unsummarized: Deque[Message] = deque()  # Trimmed before they could be folded
+        self._active_turns = 0
+        self._compaction_task: Optional[asyncio.Task] = None
+        self._compaction_cancel: Optional[threading.Event] = None
+
+        # Long-term memory recall
+        self.memory_top_k = 4
+        self.memory_min_score = 0.35
+        self.memory_budget_share = 0.25  # At most this share of the prompt budget goes to recalled memories
 
     def default_personality(self):
         """Default personality configuration"""
@@ -44,24 +104,104 @@ class AIPersonality:
             }
         }
 
+    def count_tokens(self, text: str) -> int:
+        """Count tokens with the loaded model's own tokenizer"""
+        if hasattr(self.model, "tokenize"):
+            return len(self.model.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return len(text) // 4 + 1
+
+    def context_limit(self) -> int:
+        n_ctx = getattr(self.model, "n_ctx", None)
+        return n_ctx() if callable(n_ctx) else self.context_window
+
+    def prompt_token_budget(self) -> int:
+        """Tokens left for conversation history once the reply and system prompt are reserved"""
+        max_tokens = self.personality_config["generation_params"].get("max_tokens", 0) or 0
+        budget = self.context_limit() - max_tokens - MESSAGE_OVERHEAD_TOKENS  # assistant header
+
+        if self.personality_config["system_prompt"]:
+            if self._system_prompt_tokens is None:
+                self._system_prompt_tokens = self.count_tokens(self.personality_config["system_prompt"])
+            budget -= self._system_prompt_tokens + MESSAGE_OVERHEAD_TOKENS
+
+        return budget
+
     def add_message(self, role: str, content: str):
         """Add message to conversation history"""
+        content = content.strip()
         message = Message(
             role=role,
-            content=content.strip(),
-            timestamp=time.time()
+            content=content,
+            timestamp=time.time(),
+            token_count=self.count_tokens(content)
         )
 
         self.conversation_history.append(message)
+        self._history_bytes += len(content) + MESSAGE_OVERHEAD_BYTES
+        self.message_counts[role] = self.message_counts.get(role, 0) + 1
+        if self.conversation_start is None:
+            self.conversation_start = message.timestamp
+        self.last_activity = message.timestamp
+        self._persist(message)
 
         # Trim history if too long
-        if len(self.conversation_history) > self.max_history_length:
-            system_messages = [msg for msg in self.conversation_history if msg.role == "system"]
-            recent_messages = self.conversation_history[-self.max_history_length:]
-            self.conversation_history = system_messages + recent_messages
+        while len(self.conversation_history) > self.max_history_length:
+            oldest = self.conversation_history.popleft()
+            if oldest.role == "system":
+                self.pinned_messages.append(oldest)
+            else:
+                self._history_bytes -= len(oldest.content) + MESSAGE_OVERHEAD_BYTES
+                if self.summarize:
+                    self._trimmed_unsummarized.append(oldest)
+                    if len(self._trimmed_unsummarized) > self.max_history_length:
+                        self._trimmed_unsummarized.popleft()
 
-    def format_conversation_for_model(self) -> List[Dict]:
-        """Convert conversation history to model format"""
+    def _persist(self, message: Message):
+        """
+        Append to the conversation store. A user message is held back until
+        the next message arrives, so one rejected by a full queue (and
+        discarded) never reaches disk.
+        """
+        if self.conversation_store is None or not self.session_id:
+            return
+        if self._unsaved_user_message is not None:
+            pending, self._unsaved_user_message = self._unsaved_user_message, None
+            self.conversation_store.append(self.session_id, pending.role, pending.content, pending.timestamp,
+                                           pending.token_count)
+        if message.role == "user":
+            self._unsaved_user_message = message
+        else:
+            self.conversation_store.append(self.session_id, message.role, message.content, message.timestamp,
+                                           message.token_count)
+
+    def load_history(self, stored_session, messages):
+        """Restore a session from the conversation store: totals plus its most recent messages"""
+        self.conversation_history = deque(
+            Message(role=role, content=content, timestamp=timestamp, token_count=token_count)
+            for role, content, timestamp, token_count in messages
+        )
+        self._history_bytes = sum(len(msg.content) + MESSAGE_OVERHEAD_BYTES for msg in self.conversation_history)
+        self.message_counts = {
+            "user": stored_session.user_messages,
+            "assistant": stored_session.ai_messages,
+            "system": stored_session.total_messages - stored_session.user_messages - stored_session.ai_messages
+        }
+        self.conversation_start = stored_session.conversation_start
+        self.last_activity = stored_session.last_activity
+        self.set_rolling_summary(stored_session.summary or "")
+
+    async def build_prompt(self) -> List[Dict]:
+        """Messages for this turn; the long-term memory search runs off the event loop"""
+        memory_message = None
+        if self.long_term_memory is not None:
+            token_budget = int(self.prompt_token_budget() * self.memory_budget_share)
+            memory_message = await asyncio.get_event_loop().run_in_executor(None, self.recall_memories, token_budget)
+        return self.format_conversation_for_model(memory_message)
+
+    def format_conversation_for_model(self, memory_message: Optional[Dict] = None) -> List[Dict]:
+        """Convert conversation history to model format, with recalled memories (see build_prompt) if any"""
         messages = []
 
         if self.personality_config["system_prompt"]:
@@ -70,49 +210,552 @@ class AIPersonality:
                 "content": self.personality_config["system_prompt"]
             })
 
-        for msg in self.conversation_history[-10:]:
+        budget = self.prompt_token_budget()
+        if memory_message is not None:
+            budget -= self.count_tokens(memory_message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+        for msg in self.pinned_messages:
+            messages.append({"role": msg.role, "content": msg.content})
+            budget -= msg.token_count + MESSAGE_OVERHEAD_TOKENS
+
+        if self.rolling_summary:
+            messages.append({"role": "system", "content": self.summary_message()})
+            budget -= self._summary_tokens + MESSAGE_OVERHEAD_TOKENS
+
+        # Fill the remaining context newest-first; the latest message is always kept
+        selected = []
+        for msg in reversed(self.conversation_history):
+            cost = msg.token_count + MESSAGE_OVERHEAD_TOKENS
+            if selected and cost > budget:
+                break
+            selected.append(msg)
+            budget -= cost
+
+        for msg in reversed(selected):
             messages.append({
                 "role": msg.role,
                 "content": msg.content
             })
 
+        if memory_message is not None:
+            # Just before the newest message, so the earlier prompt prefix (and its KV cache) stays reusable
+            messages.insert(len(messages) - 1, memory_message)
+
         return messages
 
-    async def generate_response(self, user_message: str) -> str:
-        """Generate AI response to user message"""
+    def summary_message(self) -> str:
+        return f"Summary of the earlier conversation:\n{self.rolling_summary}"
 
-        self.add_message("user", user_message)
-        messages = self.format_conversation_for_model()
+    def set_rolling_summary(self, summary: str):
+        self.rolling_summary = summary
+        self._summary_tokens = self.count_tokens(self.summary_message()) if summary else 0
+
+    def _begin_turn(self):
+        self._active_turns += 1
+        # A new message takes priority over background compaction of this session
+        if self._compaction_cancel is not None:
+            self._compaction_cancel.set()
+
+    def _end_turn(self):
+        self._active_turns -= 1
+        if self.summarize and self._active_turns == 0:
+            self.schedule_compaction()
+
+    def compaction_candidates(self) -> List[Message]:
+        """Messages to fold next: anything trimmed unsummarized plus raw history beyond keep_recent"""
+        candidates = list(self._trimmed_unsummarized)
+        if len(self.conversation_history) > self.compact_after_messages:
+            fold = len(self.conversation_history) - self.keep_recent_messages
+            candidates.extend(islice(self.conversation_history, 0, fold))
+        return candidates
+
+    def schedule_compaction(self):
+        if self._compaction_task is not None and not self._compaction_task.done():
+            return
+        if not self._trimmed_unsummarized and len(self.conversation_history) <= self.compact_after_messages:
+            return
+        try:
+            self._compaction_task = asyncio.get_event_loop().create_task(self._compact_when_idle())
+        except RuntimeError:
+            pass  # No running loop (e.g. called from a script); compaction waits for the next turn
+
+    async def _compact_when_idle(self):
+        await asyncio.sleep(self.compaction_delay)
+        # Only use gaps where nobody is waiting for the model
+        while self.scheduler is not None and self.scheduler.queue_depth > 0 and self._active_turns == 0:
+            await asyncio.sleep(self.compaction_delay)
+        if self._active_turns == 0:
+            try:
+                await self.compact()
+            except Exception as e:
+                logger.error(f"Conversation compaction failed for {self.session_id}: {e}")
+
+    def summary_prompt(self, messages: List[Message]) -> List[Dict]:
+        name = self.personality_config["name"]
+        transcript = "\n".join(f"{'User' if m.role == 'user' else name}: {m.content}" for m in messages)
+        words = int(self.summary_max_tokens * 0.7)
+        return [
+            {
+                "role": "system",
+                "content": f"You keep a running summary of a conversation between a user and {name}. "
+                           f"Keep names, facts, preferences, plans and open questions; drop small talk. "
+                           f"Reply with the updated summary only, in at most {words} words."
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{self.rolling_summary or '(none yet)'}\n\n"
+                           f"New messages:\n{transcript}\n\nUpdated summary:"
+            }
+        ]
+
+    def _summarize_blocking(self, prompt: List[Dict], cancelled: threading.Event) -> Optional[str]:
+        """Runs on the inference thread; returns None if a new turn cancelled it"""
+        if cancelled.is_set():
+            return None
+        if self.summary_model and self.model_manager is not None and self.model_manager.registry:
+            model = self.model_manager.get_model(self.summary_model)
+        else:
+            model = self.model
+        engine = self.engine if self.engine is not None and self.engine.model is model else None
+        # Summaries are written by the base model, not a personality adapter
+        turn = self.model_turn(model, None) if engine is None else nullcontext()
+
+        with stage_seconds.time(stage="summarize"), turn:
+            stream = (engine or model).create_chat_completion(
+                messages=prompt,
+                stream=True,
+                max_tokens=self.summary_max_tokens,
+                temperature=0.3
+            )
+            parts = []
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                delta = chunk['choices'][0]['delta'].get('content')
+                if delta:
+                    parts.append(delta)
+            stream.close()
+        return None if cancelled.is_set() else "".join(parts).strip()
+
+    async def compact(self) -> bool:
+        """Fold the oldest turns into the rolling summary; returns True if history was compacted"""
+        folded = self.compaction_candidates()
+        if not folded:
+            return False
 
+        prompt = self.summary_prompt(folded)
+        self._compaction_cancel = threading.Event()
         try:
+            summary = await self.run_inference(
+                lambda cancelled: self._summarize_blocking(prompt, cancelled),
+                self._compaction_cancel
+            )
+        except (SchedulerBusy, GenerationCancelled):
+            # Another turn wanted the model, or the session's clients left; try again after a later turn
+            return False
+        finally:
+            self._compaction_cancel = None
+        if not summary:
+            return False
+
+        folded_ids = {id(msg) for msg in folded}
+        self._trimmed_unsummarized = deque(m for m in self._trimmed_unsummarized if id(m) not in folded_ids)
+        while self.conversation_history and id(self.conversation_history[0]) in folded_ids:
+            oldest = self.conversation_history.popleft()
+            self._history_bytes -= len(oldest.content) + MESSAGE_OVERHEAD_BYTES
+
+        self.set_rolling_summary(summary)
+        if self.conversation_store is not None and self.session_id:
+            self.conversation_store.save_summary(self.session_id, summary, folded[-1].timestamp)
+        return True
+
+    def recall_memories(self, token_budget: int) -> Optional[Dict]:
+        """System message with past exchanges relevant to the latest user message, within token_budget"""
+        if self.long_term_memory is None or not self.session_id or not self.conversation_history:
+            return None
+        latest = self.conversation_history[-1]
+        if latest.role != "user":
+            return None
+
+        # Anything still in the history is already in the prompt
+        memories = self.long_term_memory.search(
+            latest.content,
+            session_id=self.session_id,
+            k=self.memory_top_k,
+            min_score=self.memory_min_score,
+            before=self.conversation_history[0].timestamp
+        )
+
+        header = "Things you remember from earlier conversations with this user:"
+        lines = []
+        budget = token_budget - self.count_tokens(header)
+        for memory in memories:
+            cost = self.count_tokens(memory.text)
+            if cost > budget:
+                continue
+            lines.append(f"- {memory.text}")
+            budget -= cost
+        if not lines:
+            return None
+        return {"role": "system", "content": "\n".join([header] + lines)}
+
+    def remember_exchange(self, user_message: str, ai_response: str):
+        """Index the exchange in long-term memory on a worker thread (embedding and disk writes)"""
+        if self.long_term_memory is None or not self.session_id or not ai_response:
+            return
+        session_id = self.session_id
+        text = f"User: {user_message.strip()}\n{self.personality_config['name']}: {ai_response}"
+
+        def _add():
+            # Indexed by what the user said; a long reply would drown it out in the embedding
+            self.long_term_memory.add(session_id, text, embed_text=user_message)
+
+        def _on_done(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.error(f"Failed to remember exchange for {session_id}: {future.exception()}")
+
+        asyncio.get_event_loop().run_in_executor(None, _add).add_done_callback(_on_done)
+
+    def cache_namespace(self, model_name: Optional[str] = None) -> str:
+        """Cached replies are only shared between sessions with the same persona, settings and model"""
+        persona = json.dumps(
+            [self.personality_config["system_prompt"], self.personality_config["generation_params"]],
+            sort_keys=True
+        )
+        digest = hashlib.sha1(persona.encode("utf-8")).hexdigest()[:12]
+        namespace = f"{self.personality_config['name']}|{digest}|{model_name or self.model_name or ''}"
+        adapter = self.adapter_name()
+        return f"{namespace}|{adapter}" if adapter else namespace
+
+    def cache_context(self, messages: List[Dict]) -> Optional[List[str]]:
+        """
+        User messages preceding the pending one, which a cached reply depends on.
+        Assistant turns are left out: with variety > 1 they differ between
+        sessions and would split otherwise identical conversations.
+
+        None when the packed prompt holds context the key can't see (system
+        messages besides the persona prompt, or user turns older than the keyed
+        window); such replies may be personal and are never shared.
+        """
+        if self.response_cache is None:
+            return None
+        window = self.response_cache.context_messages
+        persona_prompts = 1 if self.personality_config["system_prompt"] else 0
+        if sum(1 for message in messages if message["role"] == "system") > persona_prompts \
+                or sum(1 for message in messages if message["role"] == "user") > window + 1:
+            return None
+        if not window:
+            return []
+        earlier = islice(reversed(self.conversation_history), 1, None)
+        previous = list(islice((msg.content for msg in earlier if msg.role == "user"),
+                               self.response_cache.context_messages))
+        return previous[::-1]
+
+    def cached_reply(self, user_message: str, recent: Optional[List[str]],
+                     model_name: Optional[str] = None) -> Optional[str]:
+        if self.response_cache is None or recent is None:
+            return None
+        return self.response_cache.lookup(self.cache_namespace(model_name), user_message, recent)
+
+    def remember_reply(self, user_message: str, recent: Optional[List[str]], reply: str,
+                       model_name: Optional[str] = None):
+        if self.response_cache is not None and recent is not None:
+            self.response_cache.store(self.cache_namespace(model_name), user_message, recent, reply)
+
+    def state_key(self, model=None) -> str:
+        # States are only valid for the model (and adapter) that produced them
+        key = f"{self.session_id}|{getattr(model or self.model, 'model_path', '')}"
+        adapter = self.adapter_name()
+        return f"{key}|{adapter}" if adapter else key
+
+    def adapter_name(self) -> Optional[str]:
+        """LoRA adapter for this session's turns: the session's choice, else the personality's lora_adapter"""
+        if self.lora_adapters is None:
+            return None
+        return self.lora_adapter or self.personality_config.get("lora_adapter")
+
+    @contextmanager
+    def model_turn(self, model, adapter: Optional[str], state_key: Optional[str] = None):
+        """Holds a plain model's context for one generation, with `adapter` set (None = base) if adapters are served"""
+        with model_lock(model):
+            if self.state_cache is not None:
+                # Saved before an adapter switch resets the context
+                self.state_cache.hand_over(model, state_key)
+            if self.lora_adapters is not None and hasattr(model, "ctx"):
+                with self.lora_adapters.use(model, adapter):
+                    yield
+            else:
+                yield
+
+    def restore_model_state(self, model):
+        """Put this session's KV cache back into the model before a turn"""
+        if self.state_cache is not None and self.session_id:
+            self.state_cache.restore(self.state_key(model), model)
+
+    def save_model_state(self, model):
+        """Keep the KV cache after a reply so the next turn only evaluates new tokens"""
+        if self.state_cache is not None and self.session_id:
+            # Copied out only when another session takes the context
+            self.state_cache.claim(self.state_key(model), model)
+
+    async def resolve_model(self, model_name: Optional[str] = None):
+        """
+        Pick the registry model for this turn before its prompt is packed, so
+        the token budget uses that model's context size and tokenizer. Loading
+        on demand runs off the event loop.
+        """
+        if self.model_manager is not None and self.model_manager.registry:
             loop = asyncio.get_event_loop()
+            self.model = await loop.run_in_executor(None, self.model_manager.get_model, model_name or self.model_name)
+        return self.model
+
+    async def run_inference(self, fn, cancel_event: threading.Event, on_queue_position=None):
+        """Run a blocking model call through the shared scheduler (or the default pool without one)"""
+        submitted = time.perf_counter()
 
-            def _generate():
-                return self.model.create_chat_completion(
+        def _timed(cancelled):
+            stage_seconds.observe(time.perf_counter() - submitted, stage="queue_wait")
+            return fn(cancelled)
+
+        if self.scheduler is not None:
+            return await self.scheduler.submit(
+                self.session_id or str(id(self)),
+                _timed,
+                cancel_event=cancel_event,
+                on_position=on_queue_position
+            )
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, _timed, cancel_event)
+
+    def stream_completion(self, messages: List[Dict], cancel_event: threading.Event, on_delta=None,
+                          model=None) -> str:
+        """Blocking streamed completion on model (default: self.model) that stops once cancel_event is set"""
+        model = model or self.model
+        adapter = self.adapter_name()
+        # The batched engine only serves the model it was built on, without adapters (they are per context)
+        engine = self.engine if self.engine is not None and self.engine.model is model and adapter is None else None
+        backend = engine or model
+        start = time.perf_counter()
+        state_key = self.state_key(model) if self.state_cache is not None and self.session_id else None
+        turn = self.model_turn(model, adapter, state_key) if engine is None else nullcontext()
+        # The batched engine decodes many sequences per pass already, so drafts only go to the plain model
+        speculation = self.speculative_turn(model) if engine is None else None
+        parts = []
+        first_token_at = None
+        with turn:
+            if engine is None:
+                self.restore_model_state(model)
+            with speculation or nullcontext():
+                stream = backend.create_chat_completion(
                     messages=messages,
+                    stream=True,
                     **self.personality_config["generation_params"]
                 )
+                for chunk in stream:
+                    if cancel_event.is_set():
+                        break
+                    delta = chunk['choices'][0]['delta'].get('content')
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        parts.append(delta)
+                        if on_delta:
+                            on_delta(delta)
+                stream.close()
+            if engine is None:
+                self.save_model_state(model)
+        if speculation is not None:
+            speculation.finish(len(parts))
+        self._record_generation_metrics(start, first_token_at, len(parts))
+        return "".join(parts)
+
+    def speculative_turn(self, model):
+        """
+        Draft attachment for this personality's "speculative" config, or None
+        for plain decoding (not configured, or the model can't verify drafts)
+        """
+        config = self.personality_config.get("speculative")
+        if not config or model is None:
+            return None
+        return get_speculative_decoding(config, self.model_manager).attach(model)
 
-            response = await loop.run_in_executor(None, _generate)
-            ai_response = response['choices'][0]['message']['content'].strip()
+    @staticmethod
+    def _record_generation_metrics(start: float, first_token_at: Optional[float], n_chunks: int):
+        """Prompt eval is time to first token; decode rate counts one streamed chunk per token"""
+        end = time.perf_counter()
+        if first_token_at is None:
+            return
+        stage_seconds.observe(first_token_at - start, stage="prompt_eval")
+        decode_seconds = end - first_token_at
+        stage_seconds.observe(decode_seconds, stage="decode")
+        generated_tokens.inc(n_chunks)
+        if n_chunks > 1 and decode_seconds > 0:
+            tokens_per_second.observe((n_chunks - 1) / decode_seconds)
+
+    def _discard_pending_user_message(self, user_message: str):
+        if self.conversation_history and self.conversation_history[-1].role == "user" \
+                and self.conversation_history[-1].content == user_message.strip():
+            message = self.conversation_history.pop()
+            self._history_bytes -= len(message.content) + MESSAGE_OVERHEAD_BYTES
+            self.message_counts["user"] -= 1
+            if self._unsaved_user_message is message:
+                self._unsaved_user_message = None
+
+    async def generate_response(self, user_message: str, on_queue_position=None, model_name=None) -> str:
+        """Generate AI response to user message"""
+
+        self._begin_turn()
+        try:
+            model = await self.resolve_model(model_name)
+        except BaseException:
+            self._end_turn()
+            raise
+        self.add_message("user", user_message)
+
+        try:
+            messages = await self.build_prompt()
+            recent = self.cache_context(messages)
+            cached = self.cached_reply(user_message, recent, model_name)
+            if cached is not None:
+                self.add_message("assistant", cached)
+                return cached
+
+            def _generate(cancel_event):
+                return self.stream_completion(messages, cancel_event, model=model)
+
+            cancel_event = threading.Event()
+            response = await self.run_inference(_generate, cancel_event, on_queue_position)
+            ai_response = response.strip()
+            if cancel_event.is_set():
+                # Cut off by scheduler.cancel (the client left): nobody saw it, so keep
+                # the truncated reply out of history, the response cache and memory
+                self._discard_pending_user_message(user_message)
+                raise GenerationCancelled(f"Generation cancelled for {self.session_id}")
 
             self.add_message("assistant", ai_response)
+            self.remember_reply(user_message, recent, ai_response, model_name)
+            self.remember_exchange(user_message, ai_response)
 
             return ai_response
 
+        except SchedulerBusy:
+            # Not admitted: leave history as if the message was never sent
+            self._discard_pending_user_message(user_message)
+            raise
+
+        except GenerationCancelled:
+            # The client left before the reply was generated; no assistant turn is recorded
+            self._discard_pending_user_message(user_message)
+            raise
+
         except Exception as e:
             error_response = f"Sorry, I encountered an error: {str(e)}"
             self.add_message("assistant", error_response)
             return error_response
 
+        finally:
+            self._end_turn()
+
+    async def generate_response_stream(self, user_message: str, on_queue_position=None,
+                                       model_name=None) -> AsyncIterator[str]:
+        """Generate AI response incrementally, yielding text deltas as the model produces them"""
+
+        self._begin_turn()
+        try:
+            model = await self.resolve_model(model_name)
+        except BaseException:
+            self._end_turn()
+            raise
+        self.add_message("user", user_message)
+
+        try:
+            messages = await self.build_prompt()
+        except BaseException:
+            self._end_turn()
+            raise
+        recent = self.cache_context(messages)
+        cached = self.cached_reply(user_message, recent, model_name)
+        if cached is not None:
+            self.add_message("assistant", cached)
+            self._end_turn()
+            yield cached
+            return
+
+        loop = asyncio.get_event_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        cancel_event = threading.Event()
+
+        def _generate(cancelled):
+            self.stream_completion(
+                messages,
+                cancelled,
+                on_delta=lambda delta: loop.call_soon_threadsafe(queue.put_nowait, delta),
+                model=model
+            )
+
+        def _on_done(future):
+            # Runs after every delta queued by the worker, so ordering is preserved
+            if future.cancelled():
+                queue.put_nowait(finished)
+            elif future.exception() is not None:
+                queue.put_nowait(future.exception())
+            else:
+                queue.put_nowait(finished)
+
+        parts: List[str] = []
+        ai_response = None
+        completed = False
+        generation = asyncio.ensure_future(self.run_inference(_generate, cancel_event, on_queue_position))
+        generation.add_done_callback(_on_done)
+
+        try:
+            while True:
+                item = await queue.get()
+                if item is finished:
+                    completed = not cancel_event.is_set()
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                parts.append(item)
+                yield item
+
+        except (SchedulerBusy, GenerationCancelled):
+            self._discard_pending_user_message(user_message)
+            ai_response = ""
+            raise
+
+        except Exception as e:
+            ai_response = f"Sorry, I encountered an error: {str(e)}"
+            yield ai_response
+
+        finally:
+            # Stop the worker if the consumer went away mid-reply, then commit
+            # whatever was produced so history stays consistent
+            cancel_event.set()
+            if not generation.done():
+                generation.cancel()
+            if ai_response is None:
+                ai_response = "".join(parts).strip()
+            if ai_response:
+                self.add_message("assistant", ai_response)
+                if completed:
+                    self.remember_reply(user_message, recent, ai_response, model_name)
+                    self.remember_exchange(user_message, ai_response)
+            self._end_turn()
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the in-memory conversation history"""
+        return self._history_bytes
+
     def get_conversation_summary(self) -> Dict:
-        """Get summary of current conversation"""
+        """Get summary of the whole conversation (not just the messages still in memory)"""
         return {
-            "total_messages": len(self.conversation_history),
-            "user_messages": len([m for m in self.conversation_history if m.role == "user"]),
-            "ai_messages": len([m for m in self.conversation_history if m.role == "assistant"]),
-            "conversation_start": self.conversation_history[0].timestamp if self.conversation_history else None,
-            "last_activity": self.conversation_history[-1].timestamp if self.conversation_history else None
+            "total_messages": sum(self.message_counts.values()),
+            "user_messages": self.message_counts["user"],
+            "ai_messages": self.message_counts["assistant"],
+            "conversation_start": self.conversation_start,
+            "last_activity": self.last_activity
         }
 
 # Usage example
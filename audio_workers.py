@@ -0,0 +1,85 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from server.metrics import stage_seconds
+
+
+def _init_stt_worker():
+    # Load (and exercise) the Whisper weights once per worker process
+    from ai_core.speech_to_text import warmup
+    warmup()
+
+
+def _transcribe_in_worker(audio_path: str) -> str:
+    from ai_core.speech_to_text import transcribe_audio
+    return transcribe_audio(audio_path)
+
+
+def _transcribe_samples_in_worker(samples) -> str:
+    from ai_core.speech_to_text import transcribe_samples
+    return transcribe_samples(samples)
+
+
+def _synthesize_in_thread(text: str) -> str:
+    from ai_core.text_to_speech import text_to_speech
+    return text_to_speech(text)
+
+
+class AudioWorkers:
+    """
+    Dedicated executors for the blocking audio stages.
+
+    Whisper is CPU-bound and holds the GIL, so it runs in a process pool;
+    TTS is network/disk I/O and runs in a thread pool. Each side has its own
+    concurrency limit and timeout so a burst of voice traffic can't stall the
+    event loop or starve the other stage.
+    """
+
+    def __init__(self, stt_workers: int = 1, tts_workers: int = 4,
+                 stt_concurrency: Optional[int] = None, tts_concurrency: Optional[int] = None,
+                 stt_timeout: float = 60, tts_timeout: float = 30):
+        # spawn: forking a process that already runs llama.cpp and server threads is unsafe
+        self.stt_pool = ProcessPoolExecutor(
+            max_workers=stt_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_stt_worker
+        )
+        self.tts_pool = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts")
+
+        self.stt_limit = asyncio.Semaphore(stt_concurrency or stt_workers * 2)
+        self.tts_limit = asyncio.Semaphore(tts_concurrency or tts_workers * 2)
+        self.stt_timeout = stt_timeout
+        self.tts_timeout = tts_timeout
+
+    async def _run(self, stage: str, pool, limit: asyncio.Semaphore, timeout: float, fn, *args):
+        # Timed here rather than in the workers: STT runs in other processes, whose metrics we can't scrape
+        loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        try:
+            async with limit:
+                return await asyncio.wait_for(loop.run_in_executor(pool, fn, *args), timeout)
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, stage=stage)
+
+    async def transcribe(self, audio_path: str) -> str:
+        return await self._run("stt", self.stt_pool, self.stt_limit, self.stt_timeout, _transcribe_in_worker,
+                               audio_path)
+
+    async def transcribe_samples(self, samples) -> str:
+        """Transcribe an in-memory float32 buffer (no temp file round trip)"""
+        return await self._run("stt", self.stt_pool, self.stt_limit, self.stt_timeout,
+                               _transcribe_samples_in_worker, samples)
+
+    async def synthesize(self, text: str) -> str:
+        return await self._run("tts", self.tts_pool, self.tts_limit, self.tts_timeout, _synthesize_in_thread, text)
+
+    def warmup(self) -> List[Future]:
+        """Start the Whisper workers now instead of on the first voice request"""
+        return [self.stt_pool.submit(_init_stt_worker) for _ in range(self.stt_pool._max_workers)]
+
+    def shutdown(self):
+        self.stt_pool.shutdown(wait=False, cancel_futures=True)
+        self.tts_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import platform
+import time
+from typing import Dict, List, Optional
+
+PROFILE_PATH = os.environ.get("ANYA_LLAMA_PROFILE", "llama_profile.json")
+
+BENCH_LINE = "You are Anya, a friendly and energetic AI companion who loves helping people and learning new things."
+BENCH_QUESTION = "\nTell me a short story about a robot learning to cook."
+
+# Long enough that prompt evaluation dominates the time to first token
+BENCH_PROMPT = " ".join([BENCH_LINE] * 12) + BENCH_QUESTION
+
+# Share of the context the n_ctx stage fills, since a bigger context only costs once it's used
+CONTEXT_FILL = 0.75
+
+
+def physical_core_count() -> int:
+    """Physical cores (hyper-threads rarely help llama.cpp decode), falling back to logical / 2"""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+def gpu_offload_supported() -> bool:
+    try:
+        import llama_cpp
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except Exception:
+        return False
+
+
+def host_fingerprint() -> Dict:
+    return {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "logical_cpus": os.cpu_count(),
+        "physical_cores": physical_core_count(),
+        "gpu_offload": gpu_offload_supported(),
+    }
+
+
+def default_params() -> Dict:
+    """Safe defaults for an untuned host"""
+    return {
+        "n_threads": physical_core_count(),
+        "n_batch": 512,
+        "n_ctx": 4096,
+        "n_gpu_layers": -1 if gpu_offload_supported() else 0,
+        "use_mmap": True,
+        "use_mlock": False,
+    }
+
+
+def load_profile(model_path: str, profile_path: str = PROFILE_PATH) -> Dict:
+    """Tuned llama.cpp parameters for this model on this host, or {} if none were saved"""
+    if not os.path.exists(profile_path):
+        return {}
+    try:
+        with open(profile_path, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    profile = profiles.get(os.path.basename(model_path))
+    if not profile:
+        return {}
+    if profile.get("host", {}).get("logical_cpus") != os.cpu_count():
+        # Tuned on a different machine (e.g. a copied repo); don't trust it
+        return {}
+    return profile.get("params", {})
+
+
+def save_profile(model_path: str, params: Dict, results: List[Dict], profile_path: str = PROFILE_PATH):
+    profiles = {}
+    if os.path.exists(profile_path):
+        with open(profile_path, "r", encoding="utf-8") as f:
+            profiles = json.load(f)
+
+    profiles[os.path.basename(model_path)] = {
+        "host": host_fingerprint(),
+        "params": params,
+        "tuned_at": time.time(),
+        "results": results,
+    }
+    with open(profile_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+
+
+def filled_prompt(llm, fill: float, decode_tokens: int) -> str:
+    """BENCH_LINE repeated until the prompt takes `fill` of the context, leaving room for the reply"""
+    target = int(llm.n_ctx() * fill) - decode_tokens
+    line_tokens = len(llm.tokenize((" " + BENCH_LINE).encode("utf-8"), add_bos=False))
+    question_tokens = len(llm.tokenize(BENCH_QUESTION.encode("utf-8")))
+    repeats = max(1, (target - question_tokens) // line_tokens)
+    return " ".join([BENCH_LINE] * repeats) + BENCH_QUESTION
+
+
+def benchmark(model_path: str, params: Dict, decode_tokens: int = 64, fill: Optional[float] = None) -> Dict:
+    """
+    Load the model with params and measure prompt-eval and decode tokens/sec,
+    on BENCH_PROMPT or on a prompt filling `fill` of the context
+    """
+    from llama_cpp import Llama
+
+    load_start = time.perf_counter()
+    llm = Llama(model_path=model_path, verbose=False, **params)
+    load_seconds = time.perf_counter() - load_start
+
+    prompt = filled_prompt(llm, fill, decode_tokens) if fill else BENCH_PROMPT
+    prompt_tokens = len(llm.tokenize(prompt.encode("utf-8")))
+    llm.reset()
+
+    start = time.perf_counter()
+    first_token_at = None
+    generated = 0
+    for _ in llm.create_completion(prompt, max_tokens=decode_tokens, temperature=0.0, stream=True):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        generated += 1
+    end = time.perf_counter()
+    del llm
+
+    prompt_seconds = (first_token_at or end) - start
+    decode_seconds = end - (first_token_at or end)
+    return {
+        "params": params,
+        "load_seconds": load_seconds,
+        "prompt_tokens_per_second": prompt_tokens / prompt_seconds if prompt_seconds > 0 else 0.0,
+        "decode_tokens_per_second": (generated - 1) / decode_seconds if generated > 1 and decode_seconds > 0 else 0.0,
+    }
+
+
+def score(result: Dict, prompt_weight: float) -> float:
+    """Weighted throughput; chat turns are mostly decode, so decode counts more by default"""
+    return prompt_weight * result["prompt_tokens_per_second"] / 100 + result["decode_tokens_per_second"]
+
+
+def autotune(model_path: str, n_ctx_options: Optional[List[int]] = None, prompt_weight: float = 0.3,
+             decode_tokens: int = 64) -> Dict:
+    """
+    Coordinate search over llama.cpp runtime parameters.
+
+    A full grid means reloading a multi-GB model dozens of times, so each
+    parameter is tuned in turn while the others keep their best value so far.
+    Context sizes are benchmarked with prompts that fill most of them.
+    """
+    cores = physical_core_count()
+    logical = os.cpu_count() or cores
+    search_space = [
+        ("n_threads", sorted({max(1, cores // 2), max(1, cores - 1), cores, logical})),
+        ("n_batch", [128, 256, 512, 1024]),
+        ("n_ctx", n_ctx_options or [2048, 4096, 8192]),
+        ("memory", [(True, False), (True, True), (False, False)]),  # (use_mmap, use_mlock)
+    ]
+
+    best = default_params()
+    results = []
+
+    for name, options in search_space:
+        stage = []
+        for option in options:
+            params = dict(best)
+            if name == "memory":
+                params["use_mmap"], params["use_mlock"] = option
+            else:
+                params[name] = option
+
+            print(f"Benchmarking {name}={option} ...")
+            try:
+                result = benchmark(model_path, params, decode_tokens=decode_tokens,
+                                   fill=CONTEXT_FILL if name == "n_ctx" else None)
+            except Exception as e:
+                # e.g. mlock without enough RLIMIT_MEMLOCK, or n_ctx that doesn't fit in RAM
+                print(f"  failed: {e}")
+                continue
+
+            result_score = score(result, prompt_weight)
+            results.append(dict(result, score=result_score))
+            stage.append((params, result_score))
+            print(f"  prompt {result['prompt_tokens_per_second']:.1f} tok/s, "
+                  f"decode {result['decode_tokens_per_second']:.2f} tok/s")
+
+        if not stage:
+            continue
+        if name == "n_ctx":
+            # Each size was measured mostly full; take the largest that keeps 90% of the best throughput
+            top = max(stage_score for _, stage_score in stage)
+            best = max((p for p, stage_score in stage if stage_score >= 0.9 * top), key=lambda p: p["n_ctx"])
+        else:
+            best = max(stage, key=lambda entry: entry[1])[0]
+
+    return {"params": best, "results": results}
+
+
+if __name__ == "__main__":
+    from model.model_manager import DEFAULT_MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Benchmark llama.cpp settings on this host and save the best profile")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="GGUF file to tune")
+    parser.add_argument("--output", default=PROFILE_PATH, help="Profile file read by ModelManager.load_model")
+    parser.add_argument("--n-ctx", type=int, nargs="*", help="Context sizes to try")
+    parser.add_argument("--decode-tokens", type=int, default=64)
+    parser.add_argument("--prompt-weight", type=float, default=0.3)
+    args = parser.parse_args()
+
+    tuned = autotune(args.model, n_ctx_options=args.n_ctx, prompt_weight=args.prompt_weight,
+                     decode_tokens=args.decode_tokens)
+    save_profile(args.model, tuned["params"], tuned["results"], profile_path=args.output)
+    print(f"Saved profile for {os.path.basename(args.model)} to {args.output}: {tuned['params']}")
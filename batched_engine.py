@@ -0,0 +1,369 @@
+import codecs
+import queue
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import llama_cpp
+
+
+def format_chatml(messages: List[Dict]) -> str:
+    """Render messages the way chat_format="chatml" does, ending on the assistant header"""
+    prompt = "".join(f"<|im_start|>{m['role']}\n{m['content']}<|im_end|>\n" for m in messages)
+    return prompt + "<|im_start|>assistant\n"
+
+
+def _kv_seq_rm_api():
+    """The function freeing a sequence's KV cells, which was renamed across llama.cpp versions"""
+    if hasattr(llama_cpp, "llama_memory_seq_rm") and hasattr(llama_cpp, "llama_get_memory"):
+        return lambda ctx, seq_id: llama_cpp.llama_memory_seq_rm(llama_cpp.llama_get_memory(ctx), seq_id, -1, -1)
+    for name in ("llama_kv_self_seq_rm", "llama_kv_cache_seq_rm"):
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return lambda ctx, seq_id: fn(ctx, seq_id, -1, -1)
+    # Without it a reused slot would attend to the previous sequence's cells
+    raise RuntimeError("This llama-cpp-python build can't free KV cells per sequence; upgrade llama-cpp-python")
+
+
+def _held_back(text: str, stops: List[str]) -> int:
+    """Length of the longest tail of text that could still grow into a stop string"""
+    longest = 0
+    for stop in stops:
+        for size in range(min(len(stop) - 1, len(text)), longest, -1):
+            if text.endswith(stop[:size]):
+                longest = size
+                break
+    return longest
+
+
+@dataclass(eq=False)
+class SequenceRequest:
+    prompt_tokens: List[int]
+    max_tokens: int
+    temperature: float = 0.8
+    top_p: float = 0.95
+    top_k: int = 40
+    repeat_penalty: float = 1.1
+    stop: List[str] = field(default_factory=list)
+    seed: Optional[int] = None
+
+    request_id: str = field(default_factory=lambda: f"chatcmpl-{uuid.uuid4().hex}")
+    seq_id: int = -1
+    n_past: int = 0
+    prompt_cursor: int = 0
+    generated: List[int] = field(default_factory=list)
+    text: str = ""
+    sent: int = 0  # Characters of text passed to the consumer; the rest may start a stop string
+    cancelled: bool = False
+    events: "queue.Queue" = field(default_factory=queue.Queue)
+
+    def __post_init__(self):
+        self.rng = np.random.default_rng(self.seed)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def prefilled(self) -> bool:
+        return self.prompt_cursor >= len(self.prompt_tokens)
+
+
+class BatchedGenerationEngine:
+    """
+    Continuous batching on top of an already loaded Llama.
+
+    The engine owns a second llama.cpp context on the same weights, sized for
+    n_parallel sequences. A single decode thread packs one token per running
+    sequence plus chunks of newly admitted prompts into each llama_batch, so
+    concurrent clients share every pass over the weights instead of taking
+    turns. New requests join between decode steps.
+    """
+
+    def __init__(self, model, n_parallel: int = 4, n_ctx_per_seq: Optional[int] = None,
+                 n_batch: int = 512, n_threads: Optional[int] = None):
+        self.model = model
+        self.n_parallel = n_parallel
+        self.n_ctx_per_seq = n_ctx_per_seq or model.n_ctx()
+        self.n_batch = n_batch
+        self.n_vocab = model.n_vocab()
+        self._kv_seq_rm = _kv_seq_rm_api()
+
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.n_ctx_per_seq * n_parallel
+        params.n_batch = n_batch
+        params.n_seq_max = n_parallel
+        if n_threads:
+            params.n_threads = n_threads
+            params.n_threads_batch = n_threads
+        self.ctx = llama_cpp.llama_new_context_with_model(model.model, params)
+        if not self.ctx:
+            raise RuntimeError("Failed to create batched llama.cpp context")
+        self.batch = llama_cpp.llama_batch_init(n_batch, 0, n_parallel)
+
+        self.stop_tokens = {model.token_eos()}
+        im_end = model.tokenize(b"<|im_end|>", add_bos=False, special=True)
+        if len(im_end) == 1:
+            self.stop_tokens.add(im_end[0])
+
+        self._pending: "queue.Queue[SequenceRequest]" = queue.Queue()
+        self._active: List[SequenceRequest] = []
+        self._free_seq_ids = list(range(n_parallel))
+        # Held while submitting so close() can't miss a request queued as it shuts down
+        self._submit_lock = threading.Lock()
+
+        # Throughput counters
+        self.tokens_generated = 0
+        self.decode_steps = 0
+        self.started_at = time.time()
+
+        self._running = True
+        self._thread = threading.Thread(target=self._decode_loop, name="batched-decode", daemon=True)
+        self._thread.start()
+
+    def n_ctx(self) -> int:
+        return self.n_ctx_per_seq
+
+    def tokenize(self, text: bytes, add_bos: bool = False, special: bool = True) -> List[int]:
+        return self.model.tokenize(text, add_bos=add_bos, special=special)
+
+    def create_chat_completion(self, messages: List[Dict], stream: bool = False, **params):
+        """Same call shape as Llama.create_chat_completion for the parameters the personalities use"""
+        max_tokens = params.get("max_tokens") or 256
+        # Prompt + reply has to fit this sequence's slice of the context
+        prompt_tokens = self._fit_prompt(messages, self.n_ctx_per_seq - max_tokens)
+
+        request = SequenceRequest(
+            prompt_tokens=prompt_tokens,
+            max_tokens=max_tokens,
+            temperature=params.get("temperature", 0.8),
+            top_p=params.get("top_p", 0.95),
+            top_k=params.get("top_k", 40),
+            repeat_penalty=params.get("repeat_penalty", 1.1),
+            stop=list(params.get("stop") or []),
+            seed=params.get("seed")
+        )
+        with self._submit_lock:
+            if not self._running:
+                raise RuntimeError("Batched engine is closed")
+            self._pending.put(request)
+
+        chunks = self._stream(request)
+        if stream:
+            return chunks
+
+        text = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+        return {
+            "id": request.request_id,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+        }
+
+    def _render(self, messages: List[Dict]) -> List[int]:
+        return self.model.tokenize(format_chatml(messages).encode("utf-8"), add_bos=False, special=True)
+
+    def _fit_prompt(self, messages: List[Dict], limit: int) -> List[int]:
+        """Tokens of the prompt, dropping the oldest whole messages after the system prompt if it's too long"""
+        prompt_tokens = self._render(messages)
+        if len(prompt_tokens) <= limit:
+            return prompt_tokens
+
+        head = 1 if messages and messages[0]["role"] == "system" else 0
+        # format_chatml renders each message independently, so their token counts add up
+        costs = [len(self._render([message])) - len(self._render([])) for message in messages]
+        total = len(prompt_tokens)
+        keep = head
+        while total > limit and keep < len(messages) - 1:
+            total -= costs[keep]
+            keep += 1
+        if total > limit:
+            raise ValueError(f"Requested tokens ({total}) exceed context window of {limit}")
+        return self._render(messages[:head] + messages[keep:])
+
+    def _stream(self, request: SequenceRequest) -> Iterator[Dict]:
+        try:
+            while True:
+                event = request.events.get()
+                if event is None:
+                    return
+                if isinstance(event, Exception):
+                    raise event
+                yield {
+                    "id": request.request_id,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": event}, "finish_reason": None}]
+                }
+        finally:
+            # Consumer stopped iterating (finished, cancelled or disconnected)
+            request.cancelled = True
+
+    def _admit(self, block: bool):
+        while self._free_seq_ids:
+            try:
+                request = self._pending.get(block=block and not self._active, timeout=0.1)
+            except queue.Empty:
+                return
+            if request.cancelled:
+                request.events.put(None)
+                continue
+            request.seq_id = self._free_seq_ids.pop()
+            self._active.append(request)
+
+    def _release(self, request: SequenceRequest, error: Optional[Exception] = None):
+        self._kv_seq_rm(self.ctx, request.seq_id)
+        self._free_seq_ids.append(request.seq_id)
+        self._active.remove(request)
+        request.events.put(error)
+
+    def _add_token(self, token: int, pos: int, seq_id: int, logits: bool):
+        i = self.batch.n_tokens
+        self.batch.token[i] = token
+        self.batch.pos[i] = pos
+        self.batch.n_seq_id[i] = 1
+        self.batch.seq_id[i][0] = seq_id
+        self.batch.logits[i] = logits
+        self.batch.n_tokens += 1
+
+    def _decode_loop(self):
+        while self._running:
+            self._admit(block=True)
+
+            for request in list(self._active):
+                if request.cancelled:
+                    self._release(request)
+
+            if not self._active:
+                continue
+
+            self.batch.n_tokens = 0
+            sampling: Dict[int, SequenceRequest] = {}
+
+            # One token for every sequence that is already generating
+            for request in self._active:
+                if request.prefilled and request.generated:
+                    sampling[self.batch.n_tokens] = request
+                    self._add_token(request.generated[-1], request.n_past, request.seq_id, True)
+                    request.n_past += 1
+
+            # Fill the rest of the batch with prompt chunks of newly admitted sequences
+            for request in self._active:
+                if request.prefilled:
+                    continue
+                room = self.n_batch - self.batch.n_tokens
+                if room <= 0:
+                    break
+                chunk = request.prompt_tokens[request.prompt_cursor:request.prompt_cursor + room]
+                for offset, token in enumerate(chunk):
+                    last = request.prompt_cursor + offset == len(request.prompt_tokens) - 1
+                    if last:
+                        sampling[self.batch.n_tokens] = request
+                    self._add_token(token, request.n_past, request.seq_id, last)
+                    request.n_past += 1
+                request.prompt_cursor += len(chunk)
+
+            if self.batch.n_tokens == 0:
+                continue
+
+            status = llama_cpp.llama_decode(self.ctx, self.batch)
+            if status != 0:
+                error = RuntimeError(f"llama_decode failed with status {status}")
+                for request in list(self._active):
+                    self._release(request, error)
+                continue
+            self.decode_steps += 1
+
+            for index, request in sampling.items():
+                logits = np.ctypeslib.as_array(llama_cpp.llama_get_logits_ith(self.ctx, index), shape=(self.n_vocab,))
+                token = self._sample(request, logits)
+                self._emit(request, token)
+
+    def _sample(self, request: SequenceRequest, logits: np.ndarray) -> int:
+        logits = logits.astype(np.float32, copy=True)
+
+        if request.repeat_penalty != 1.0:
+            recent = np.unique(np.array((request.prompt_tokens + request.generated)[-64:], dtype=np.int64))
+            if recent.size:
+                values = logits[recent]
+                logits[recent] = np.where(values > 0, values / request.repeat_penalty, values * request.repeat_penalty)
+
+        if request.temperature <= 0:
+            return int(np.argmax(logits))
+
+        logits /= request.temperature
+
+        top_k = request.top_k if request.top_k and request.top_k > 0 else self.n_vocab
+        top_k = min(top_k, self.n_vocab)
+        candidates = np.argpartition(logits, -top_k)[-top_k:]
+        candidates = candidates[np.argsort(logits[candidates])[::-1]]
+
+        probs = np.exp(logits[candidates] - logits[candidates[0]])
+        probs /= probs.sum()
+
+        if request.top_p < 1.0:
+            keep = int(np.searchsorted(np.cumsum(probs), request.top_p)) + 1
+            candidates, probs = candidates[:keep], probs[:keep] / probs[:keep].sum()
+
+        return int(request.rng.choice(candidates, p=probs))
+
+    def _send(self, request: SequenceRequest, end: int):
+        if end > request.sent:
+            request.events.put(request.text[request.sent:end])
+            request.sent = end
+
+    def _emit(self, request: SequenceRequest, token: int):
+        if token in self.stop_tokens:
+            self._send(request, len(request.text))
+            self._release(request)
+            return
+
+        request.generated.append(token)
+        self.tokens_generated += 1
+
+        piece = request.decoder.decode(self.model.detokenize([token]))
+        if piece:
+            request.text += piece
+            # Text before `sent` can't start a stop string: it was held back while it could
+            found = [index for index in (request.text.find(stop, request.sent) for stop in request.stop) if index >= 0]
+            if found:
+                self._send(request, min(found))
+                self._release(request)
+                return
+            self._send(request, len(request.text) - _held_back(request.text, request.stop))
+
+        if len(request.generated) >= request.max_tokens or request.n_past >= self.n_ctx_per_seq:
+            self._send(request, len(request.text))
+            self._release(request)
+
+    def stats(self) -> Dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "n_parallel": self.n_parallel,
+            "active_sequences": len(self._active),
+            "pending_requests": self._pending.qsize(),
+            "tokens_generated": self.tokens_generated,
+            "decode_steps": self.decode_steps,
+            "tokens_per_second": self.tokens_generated / elapsed
+        }
+
+    def busy(self) -> bool:
+        return bool(self._active) or not self._pending.empty()
+
+    def close(self):
+        """Stop decoding, fail every unfinished request, then free the context"""
+        with self._submit_lock:
+            self._running = False
+        # The loop exits after its current step; the context can't be freed under it
+        self._thread.join()
+
+        error = RuntimeError("Batched engine closed: its model was unloaded")
+        for request in self._active:
+            request.events.put(error)
+        self._active.clear()
+        while True:
+            try:
+                self._pending.get_nowait().events.put(error)
+            except queue.Empty:
+                break
+
+        llama_cpp.llama_batch_free(self.batch)
+        llama_cpp.llama_free(self.ctx)
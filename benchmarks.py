@@ -0,0 +1,287 @@
+"""
+Microbenchmarks for the per-turn hot path, runnable offline.
+
+The real Llama, Whisper and ElevenLabs backends are replaced by deterministic
+stand-ins, so the numbers measure our own code: history bookkeeping, prompt
+packing, JSON framing and the handler flow around generation and around
+transcription (uploaded clips and VAD-segmented audio streams).
+
+    python benchmarks.py                      # run and print a report
+    python benchmarks.py --save-baseline      # store results as the new baseline
+    python benchmarks.py --baseline FILE      # compare (exit 1 on regressions)
+"""
+import argparse
+import asyncio
+import base64
+import gc
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import wave
+import zlib
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from ai_core.ai_brain import AIPersonality
+from ai_core.session_manager import SessionManager
+from model.inference_scheduler import InferenceScheduler
+from server.readiness import READY, readiness
+from server.websocket_server import WebSocketServer
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+SAMPLE_MESSAGES = [
+    "Hey",
+    "How are you feeling today?",
+    "Tell me a joke about computers and coffee.",
+    "I've been thinking about learning to cook more seriously, where should I start if I only have a "
+    "tiny kitchen and about thirty minutes each evening?",
+]
+
+REPLY_WORDS = ("Sure! Here is a friendly and fairly typical reply from Anya. It has a couple of sentences, "
+               "so the streaming and sentence splitting paths get exercised too.").split(" ")
+
+
+def spoken_pcm(sample_rate: int = 16000) -> bytes:
+    """pcm_s16le audio the VAD reads as one utterance: a short lead-in, 0.6 s of tone, then silence"""
+    tone = 0.3 * np.sin(2 * np.pi * 220 * np.arange(int(sample_rate * 0.6)) / sample_rate)
+    audio = np.concatenate([np.zeros(sample_rate // 5), tone, np.zeros(int(sample_rate * 0.7))])
+    return (audio * 32767).astype("<i2").tobytes()
+
+
+def wav_bytes(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class FakeLlama:
+    """Deterministic stand-in with the parts of the llama_cpp.Llama API we use"""
+
+    model_path = "fake.gguf"
+
+    def n_ctx(self) -> int:
+        return 4096
+
+    def tokenize(self, text: bytes, add_bos: bool = False, special: bool = True) -> List[int]:
+        return [zlib.crc32(word) & 0xFFFF for word in text.split()]
+
+    def create_chat_completion(self, messages, stream=False, **params):
+        words = [f"{w} " for w in REPLY_WORDS[:params.get("max_tokens", len(REPLY_WORDS))]]
+        if not stream:
+            return {"choices": [{"message": {"role": "assistant", "content": "".join(words)}}]}
+        return ({"choices": [{"delta": {"content": w}}]} for w in words)
+
+    def save_state(self):
+        return None
+
+    def load_state(self, state):
+        pass
+
+
+class FakeAudioWorkers:
+    """Stand-in for the Whisper process pool and TTS thread pool"""
+
+    async def transcribe(self, audio_path: str) -> str:
+        return SAMPLE_MESSAGES[1]
+
+    async def transcribe_samples(self, samples) -> str:
+        return SAMPLE_MESSAGES[1]
+
+    async def synthesize(self, text: str) -> str:
+        return f"audio_responses/{zlib.crc32(text.encode('utf-8')):08x}.mp3"
+
+
+class FakeWebSocket:
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.bytes_sent = 0
+
+    async def send(self, data):
+        self.bytes_sent += len(data)
+
+
+def measure(fn: Callable[[], None], iterations: int, warmup: int = 20) -> Dict:
+    """Per-call timings (microseconds) and memory allocated per call"""
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+
+    # Peak working memory of each call, plus what stays allocated afterwards
+    traced_calls = min(iterations, 200)
+    peaks = []
+    tracemalloc.start()
+    start_bytes, _ = tracemalloc.get_traced_memory()
+    for _ in range(traced_calls):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    end_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.fmean(timings),
+        "p50_us": timings[len(timings) // 2],
+        "p95_us": timings[int(len(timings) * 0.95) - 1],
+        "peak_alloc_bytes": statistics.fmean(peaks),
+        "retained_bytes_per_call": max(0, end_bytes - start_bytes) / traced_calls,
+    }
+
+
+def filled_personality(turns: int = 10) -> AIPersonality:
+    ai = AIPersonality(FakeLlama())
+    for i in range(turns):
+        ai.add_message("user", SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)])
+        ai.add_message("assistant", " ".join(REPLY_WORDS))
+    return ai
+
+
+def run_benchmarks(iterations: int) -> Dict[str, Dict]:
+    results = {}
+
+    ai = filled_personality()
+    counter = [0]
+
+    def add_message():
+        counter[0] += 1
+        ai.add_message("user", SAMPLE_MESSAGES[counter[0] % len(SAMPLE_MESSAGES)])
+
+    results["add_message"] = measure(add_message, iterations)
+    results["format_conversation_for_model"] = measure(filled_personality().format_conversation_for_model, iterations)
+    results["get_conversation_summary"] = measure(filled_personality().get_conversation_summary, iterations)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        readiness.set_state(READY)
+        scheduler = InferenceScheduler()
+        sessions = SessionManager(FakeLlama(), scheduler=scheduler)
+        server = WebSocketServer(sessions, scheduler=scheduler, audio_workers=FakeAudioWorkers())
+        websocket = FakeWebSocket()
+        loop.run_until_complete(server.register_client(websocket))
+        summary = server.client_sessions[websocket].ai.get_conversation_summary()
+
+        results["send_message_json"] = measure(
+            lambda: loop.run_until_complete(server.send_message(
+                websocket, "ai_response_audio", " ".join(REPLY_WORDS),
+                extra_data={"audio_path": "audio_responses/x.mp3", "conversation_summary": summary}
+            )),
+            iterations
+        )
+
+        # Whole turns are much slower than the stages above, so run fewer of them
+        turns = max(20, iterations // 20)
+        for name, stream in (("handle_user_message", False), ("handle_user_message_stream", True)):
+            results[name] = measure(
+                lambda: loop.run_until_complete(server.handle_user_message(
+                    websocket, {"type": "user_message", "content": SAMPLE_MESSAGES[2], "stream": stream}
+                )),
+                turns,
+                warmup=5
+            )
+
+        pcm = spoken_pcm()
+        upload = {"type": "audio_input", "audio_data": base64.b64encode(wav_bytes(pcm)).decode("ascii"),
+                  "format": "wav"}
+        results["handle_audio_input"] = measure(
+            lambda: loop.run_until_complete(server.handle_audio_input(websocket, upload)),
+            turns,
+            warmup=5
+        )
+
+        # 20 ms chunks, the way a client streams microphone audio
+        chunk_bytes = 16000 // 50 * 2
+        chunks = [pcm[i:i + chunk_bytes] for i in range(0, len(pcm), chunk_bytes)]
+
+        async def stream_utterance():
+            await server.handle_audio_stream_start(websocket, {"type": "audio_stream_start", "sample_rate": 16000})
+            worker = server.audio_streams[websocket].worker
+            for chunk in chunks:
+                await server.handle_audio_chunk(websocket, chunk)
+            await server.handle_audio_stream_end(websocket)
+            await worker
+
+        results["handle_audio_stream_utterance"] = measure(
+            lambda: loop.run_until_complete(stream_utterance()),
+            turns,
+            warmup=5
+        )
+        scheduler.shutdown()
+        loop.run_until_complete(asyncio.sleep(0))  # let the cancelled dispatcher finish
+    finally:
+        loop.close()
+
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        ratio = result["p50_us"] / reference["p50_us"] if reference["p50_us"] else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: p50 {reference['p50_us']:.1f}us -> {result['p50_us']:.1f}us ({ratio:.2f}x)")
+    return regressions
+
+
+def print_report(results: Dict[str, Dict], baseline: Dict[str, Dict]):
+    print(f"{'stage':34} {'p50 us':>10} {'p95 us':>10} {'peak B':>10} {'kept B':>8} {'vs base':>8}")
+    for name, result in results.items():
+        reference = baseline.get(name)
+        change = f"{result['p50_us'] / reference['p50_us']:.2f}x" if reference and reference["p50_us"] else "-"
+        print(f"{name:34} {result['p50_us']:10.1f} {result['p95_us']:10.1f} "
+              f"{result['peak_alloc_bytes']:10.0f} {result['retained_bytes_per_call']:8.0f} {change:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Hot path microbenchmarks with offline backends")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed p50 slowdown before failing")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = run_benchmarks(args.iterations)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("Regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
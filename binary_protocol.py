@@ -0,0 +1,78 @@
+"""
+Binary WebSocket frames for audio, used alongside the JSON messages.
+
+Every binary frame is an 8-byte header followed by raw audio bytes:
+
+    u8  version      PROTOCOL_VERSION
+    u8  frame_type   FRAME_* below
+    u8  codec        CODEC_* below
+    u8  flags        FLAG_* bits
+    u32 sequence     chunk / segment index (big endian)
+
+Clients opt in by sending {"type": "hello", "binary_audio": true}; the server
+answers with a "capabilities" message and from then on also sends TTS audio
+as FRAME_TTS_AUDIO frames right after the matching JSON message.
+"""
+import struct
+from dataclasses import dataclass
+
+PROTOCOL_VERSION = 1
+
+HEADER = struct.Struct("!BBBBI")
+
+# Client -> server
+FRAME_AUDIO_UPLOAD = 0x01  # A complete recorded clip (replaces base64 "audio_input")
+FRAME_AUDIO_CHUNK = 0x02   # Live PCM for the current audio stream
+
+# Server -> client
+FRAME_TTS_AUDIO = 0x10
+
+CODEC_PCM_S16LE = 0
+CODEC_FLOAT32 = 1
+CODEC_WAV = 2
+CODEC_WEBM = 3
+CODEC_MP3 = 4
+CODEC_OGG = 5
+
+CODEC_NAMES = {
+    CODEC_PCM_S16LE: "pcm_s16le",
+    CODEC_FLOAT32: "float32",
+    CODEC_WAV: "wav",
+    CODEC_WEBM: "webm",
+    CODEC_MP3: "mp3",
+    CODEC_OGG: "ogg",
+}
+
+FLAG_FINAL = 0x01         # Audio is the complete reply rather than one sentence segment
+FLAG_STREAM_REPLY = 0x02  # Upload: stream the reply (deltas + sentence audio)
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+@dataclass
+class BinaryFrame:
+    frame_type: int
+    codec: int
+    flags: int
+    sequence: int
+    payload: memoryview
+
+    @property
+    def codec_name(self) -> str:
+        return CODEC_NAMES.get(self.codec, "wav")
+
+
+def decode_frame(data: bytes) -> BinaryFrame:
+    if len(data) < HEADER.size:
+        raise ProtocolError("Binary frame shorter than header")
+    version, frame_type, codec, flags, sequence = HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported binary protocol version {version}")
+    # memoryview keeps the payload zero-copy until it is decoded
+    return BinaryFrame(frame_type, codec, flags, sequence, memoryview(data)[HEADER.size:])
+
+
+def encode_frame(frame_type: int, payload: bytes, codec: int = CODEC_MP3, flags: int = 0, sequence: int = 0) -> bytes:
+    return HEADER.pack(PROTOCOL_VERSION, frame_type, codec, flags, sequence) + payload
@@ -0,0 +1,194 @@
+import logging
+import queue
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    token_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    total_messages INTEGER NOT NULL DEFAULT 0,
+    user_messages INTEGER NOT NULL DEFAULT 0,
+    ai_messages INTEGER NOT NULL DEFAULT 0,
+    conversation_start REAL,
+    last_activity REAL,
+    summary TEXT,
+    summarized_through REAL
+);
+"""
+
+INSERT_MESSAGE = "INSERT INTO messages (session_id, role, content, timestamp, token_count) VALUES (?, ?, ?, ?, ?)"
+
+# Running totals kept alongside the messages, so a summary never has to count rows
+UPDATE_SESSION = """
+INSERT INTO sessions (session_id, total_messages, user_messages, ai_messages, conversation_start, last_activity)
+VALUES (?, 1, ? = 'user', ? = 'assistant', ?, ?)
+ON CONFLICT(session_id) DO UPDATE SET
+    total_messages = total_messages + 1,
+    user_messages = user_messages + (excluded.user_messages),
+    ai_messages = ai_messages + (excluded.ai_messages),
+    last_activity = excluded.last_activity
+"""
+
+UPDATE_SUMMARY = "UPDATE sessions SET summary = ?, summarized_through = ? WHERE session_id = ?"
+
+
+@dataclass(slots=True)
+class StoredSession:
+    session_id: str
+    total_messages: int
+    user_messages: int
+    ai_messages: int
+    conversation_start: Optional[float]
+    last_activity: Optional[float]
+    summary: Optional[str] = None
+    summarized_through: Optional[float] = None  # Messages up to this timestamp are folded into summary
+
+
+class ConversationStore:
+    """
+    Durable, append-only message log in SQLite (WAL mode).
+
+    Writes are handed to a single writer thread and committed in batches,
+    so a turn costs a queue put on the event loop rather than a disk write.
+    With WAL and synchronous=NORMAL a crash can lose the last few commits
+    but never corrupts the database. Reads use their own connection and
+    first wait for the session's queued writes, so a reconnecting client
+    sees its latest messages.
+    """
+
+    def __init__(self, path: str = "conversations.db", batch_size: int = 256):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        self._pending: Dict[str, int] = {}  # session id -> queued writes not yet committed
+        self._pending_lock = threading.Lock()
+
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.executescript(SCHEMA)
+        self._migrate()
+
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-store", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _migrate(self):
+        columns = {row[1] for row in self._reader.execute("PRAGMA table_info(sessions)")}
+        with self._reader:
+            for column, kind in (("summary", "TEXT"), ("summarized_through", "REAL")):
+                if column not in columns:
+                    self._reader.execute(f"ALTER TABLE sessions ADD COLUMN {column} {kind}")
+
+    def _put(self, session_id: str, sql: str, params: Tuple):
+        with self._pending_lock:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        self._queue.put((session_id, sql, params))
+
+    def append(self, session_id: str, role: str, content: str, timestamp: float, token_count: int = 0):
+        self._put(session_id, INSERT_MESSAGE, (session_id, role, content, timestamp, token_count))
+        self._put(session_id, UPDATE_SESSION, (session_id, role, role, timestamp, timestamp))
+
+    def save_summary(self, session_id: str, summary: str, summarized_through: float):
+        """Record a session's rolling summary and the newest message it covers"""
+        self._put(session_id, UPDATE_SUMMARY, (summary, summarized_through, session_id))
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+
+            statements = [entry for entry in batch if entry is not None]
+            try:
+                if statements:
+                    # One transaction per batch; statements keep their queue order
+                    with connection:
+                        for _, sql, params in statements:
+                            connection.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to persist {len(statements)} conversation writes: {e}")
+            finally:
+                with self._pending_lock:
+                    for session_id, _, _ in statements:
+                        if self._pending[session_id] == 1:
+                            del self._pending[session_id]
+                        else:
+                            self._pending[session_id] -= 1
+                for _ in batch:
+                    self._queue.task_done()
+
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def flush(self):
+        """Block until every queued append is committed"""
+        self._queue.join()
+
+    def load_session(self, session_id: str, limit: int) -> Tuple[Optional[StoredSession], List[Tuple]]:
+        """
+        Totals and the last `limit` messages not yet folded into the summary
+        (oldest first) as (role, content, timestamp, token_count). Blocking;
+        only waits for the writer when this session has writes queued.
+        """
+        with self._pending_lock:
+            pending = session_id in self._pending
+        if pending:
+            self.flush()
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT session_id, total_messages, user_messages, ai_messages, conversation_start, last_activity, "
+                "summary, summarized_through FROM sessions WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if row is None:
+                return None, []
+            messages = self._reader.execute(
+                "SELECT role, content, timestamp, token_count FROM messages "
+                "WHERE session_id = ? AND timestamp > ? ORDER BY id DESC LIMIT ?",
+                (session_id, row[7] or 0, limit)
+            ).fetchall()
+        return StoredSession(*row), messages[::-1]
+
+    def delete_session(self, session_id: str):
+        self.flush()
+        with self._read_lock, self._reader:
+            self._reader.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._reader.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> Dict:
+        with self._read_lock:
+            sessions, messages = self._reader.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total_messages), 0) FROM sessions"
+            ).fetchone()
+        return {"sessions": sessions, "messages": messages, "pending_writes": self._queue.qsize()}
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        with self._read_lock:
+            self._reader.close()
@@ -1,13 +1,286 @@
+import glob
+import hashlib
 import json
-from datasets import Dataset
-from typing import List, Dict
+import os
+import re
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Optional
+
+import numpy as np
+# datasets is imported where it is used, so building shards doesn't need it
+
+MANIFEST_FILE = "manifest.json"
+SHARD_PATTERN = "shard-{:05d}.jsonl"
+NORMALIZE_PATTERN = re.compile(r"\s+")
+PROGRESS_FILE = "generation_progress.txt"
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+
+GENERATION_SYSTEM_PROMPT = (
+    "You write training data for {name}, an AI companion who is {traits}. "
+    "Always answer with one JSON object and nothing else."
+)
+GENERATION_USER_PROMPT = (
+    "Write a new message a user might send to {name}, in the spirit of: \"{seed}\". "
+    "Vary the wording and situation. Then write {name}'s reply, showing that {name} is {trait}. "
+    "Keep the reply to one to three sentences. "
+    "Answer as {{\"user\": \"...\", \"reply\": \"...\"}}"
+)
+
+
+def _normalize(text: str) -> str:
+    return NORMALIZE_PATTERN.sub(" ", text.lower()).strip()
+
+
+class UInt64Set:
+    """
+    Open-addressing hash set of 64-bit integers in one numpy array.
+
+    About 16 bytes per member at the 0.5 load factor, against 70+ for a
+    Python set of ints, so the dedup state for millions of examples fits in
+    a few hundred MB. 0 marks an empty slot, so it is stored as 1.
+    """
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.slots = np.zeros(capacity, dtype=np.uint64)
+        self._view = memoryview(self.slots)  # Indexing a memoryview yields plain ints, much faster than numpy scalars
+        self.size = 0
+
+    def add(self, value: int) -> bool:
+        """Insert value; False if it was already present"""
+        value = value or 1
+        view = self._view
+        mask = len(view) - 1
+        i = value & mask
+        while True:
+            slot = view[i]
+            if slot == value:
+                return False
+            if slot == 0:
+                view[i] = value
+                self.size += 1
+                if self.size * 2 > len(view):
+                    self._grow()
+                return True
+            i = (i + 1) & mask
+
+    def _grow(self):
+        members = self.slots[self.slots != 0].tolist()
+        self._view.release()
+        self.slots = np.zeros(len(self.slots) * 2, dtype=np.uint64)
+        self._view = memoryview(self.slots)
+        self.size = 0
+        for value in members:
+            self.add(value)
+
+
+class MinHashDeduplicator:
+    """
+    Near-duplicate filter using MinHash signatures over word 3-grams and LSH banding.
+
+    An example is a near duplicate when any of its bands matches a band of an
+    earlier example. With 64 permutations in 8 bands of 8 rows, pairs with
+    Jaccard similarity 0.9 collide ~99% of the time, 0.8 ~77% and 0.5 ~3%.
+    Only band hashes are kept, not signatures.
+    """
+
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 8, shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # a, b < 2^31 and shingle hashes reduced mod 2^31 - 1, so a * x + b fits in uint64
+        self.a = rng.integers(1, self.PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, self.PRIME, size=num_perm, dtype=np.uint64)
+        # Random odd multipliers hash each band's rows to one 64-bit key (wrapping arithmetic)
+        self.band_mix = rng.integers(1, 1 << 63, size=(bands, self.rows), dtype=np.uint64) | np.uint64(1)
+        self.buckets = UInt64Set()
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _normalize(text).split()
+        n = self.shingle_size
+        shingles = {" ".join(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+        x = np.fromiter((zlib.crc32(s.encode("utf-8")) % self.PRIME for s in shingles), dtype=np.uint64,
+                        count=len(shingles))
+        return ((np.outer(self.a, x) + self.b[:, None]) % np.uint64(self.PRIME)).min(axis=1)
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        return (signature.reshape(self.bands, self.rows) * self.band_mix).sum(axis=1).tolist()
+
+    def add(self, text: str) -> bool:
+        """Record text; False if it is a near duplicate of something added before"""
+        new = [self.buckets.add(key) for key in self._band_keys(self.signature(text))]
+        return all(new)
+
+
+class ShardedDatasetWriter:
+    """
+    Streams training examples to size-capped JSON-lines shards.
+
+    Nothing is kept in memory but the dedup state: exact duplicates (after
+    lowercasing and collapsing whitespace) are dropped by a 64-bit hash, near
+    duplicates by MinHash. manifest.json lists the shards and is rewritten
+    whenever a shard is completed and on close, so it can be loaded as a
+    memory-mapped Arrow dataset with load_manifest_dataset().
+
+    Reopening a directory resumes it: complete lines of existing shards are
+    re-indexed for dedup (a torn last line from a crash is dropped) and new
+    examples continue in the last shard.
+    """
+
+    def __init__(self, directory: str, max_shard_bytes: int = 64 * 1024 * 1024, deduplicate: bool = True,
+                 near_duplicates: bool = True):
+        self.directory = directory
+        self.max_shard_bytes = max_shard_bytes
+        self.exact = UInt64Set() if deduplicate else None
+        self.near = MinHashDeduplicator() if deduplicate and near_duplicates else None
+
+        self.shards: List[Dict] = []
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self._file = None
+
+        os.makedirs(directory, exist_ok=True)
+        self._resume()
+
+    @property
+    def examples(self) -> int:
+        return sum(shard["examples"] for shard in self.shards)
+
+    @staticmethod
+    def _text(example: Dict) -> str:
+        return "\n".join([example.get("instruction", ""), example.get("input", ""), example.get("output", "")])
+
+    def _is_new(self, example: Dict) -> bool:
+        text = self._text(example)
+        if self.exact is not None:
+            digest = hashlib.blake2b(_normalize(text).encode("utf-8"), digest_size=8).digest()
+            if not self.exact.add(int.from_bytes(digest, "little")):
+                self.exact_duplicates += 1
+                return False
+        if self.near is not None and not self.near.add(text):
+            self.near_duplicates += 1
+            return False
+        return True
+
+    def _resume(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, "shard-*.jsonl"))):
+            shard = {"file": os.path.basename(path), "examples": 0, "bytes": 0}
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        example = json.loads(line)
+                    except ValueError:
+                        break
+                    self._is_new(example)
+                    shard["examples"] += 1
+                    shard["bytes"] += len(line)
+            if shard["bytes"] != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(shard["bytes"])
+            self.shards.append(shard)
+        # Duplicates already on disk were filtered when they were written
+        self.exact_duplicates = self.near_duplicates = 0
+
+    def _open_shard(self):
+        if not self.shards or self.shards[-1]["bytes"] >= self.max_shard_bytes:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self.write_manifest()
+            self.shards.append({"file": SHARD_PATTERN.format(len(self.shards)), "examples": 0, "bytes": 0})
+        if self._file is None:
+            self._file = open(os.path.join(self.directory, self.shards[-1]["file"]), "ab")
+
+    def add(self, example: Dict) -> bool:
+        """Append one example; False if it was filtered as a duplicate"""
+        if not self._is_new(example):
+            return False
+        line = (json.dumps(example, ensure_ascii=False) + "\n").encode("utf-8")
+        self._open_shard()
+        self._file.write(line)
+        self.shards[-1]["examples"] += 1
+        self.shards[-1]["bytes"] += len(line)
+        return True
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def write_manifest(self):
+        manifest = {
+            "format": "jsonl",
+            "examples": self.examples,
+            "shards": self.shards,
+            "duplicates_dropped": {"exact": self.exact_duplicates, "near": self.near_duplicates}
+        }
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + ".tmp", path)  # Readers never see a half-written manifest
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.write_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def parse_generated_pair(text: str) -> Optional[Dict]:
+    """The {"user", "reply"} object in a model answer, or None if it is missing or malformed"""
+    match = JSON_OBJECT_PATTERN.search(text)
+    if match is None:
+        return None
+    try:
+        pair = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(pair, dict):
+        return None
+    user, reply = pair.get("user"), pair.get("reply")
+    if not isinstance(user, str) or not isinstance(reply, str) or not user.strip() or not reply.strip():
+        return None
+    return {"user": user.strip(), "reply": reply.strip()}
+
+
+def load_manifest_dataset(directory: str, streaming: bool = False):
+    """
+    Load the shards listed in a directory's manifest. datasets converts them
+    to Arrow once (cached) and memory-maps the result, so the examples are not
+    held in RAM; streaming=True reads the JSON lines directly instead.
+    """
+    from datasets import load_dataset
+
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    data_files = [os.path.join(directory, shard["file"]) for shard in manifest["shards"] if shard["examples"]]
+    return load_dataset("json", data_files=data_files, split="train", streaming=streaming)
+
 
 class PersonalityDataCreator :
     #create train data
 
-    def __init__(self, charecater_name = "Anya"):
+    def __init__(self, charecater_name = "Anya", output_dir: Optional[str] = None,
+                 max_shard_bytes: int = 64 * 1024 * 1024, deduplicate: bool = True):
+        """
+        With output_dir, examples are streamed to deduplicated JSONL shards
+        there instead of collected in training_examples
+        """
         self.character_name = charecater_name
         self.training_examples = []
+        self.writer = ShardedDatasetWriter(output_dir, max_shard_bytes=max_shard_bytes,
+                                           deduplicate=deduplicate) if output_dir else None
  #0108   
 
     def add_conversation_example(self,user_input: str, ai_response: str , context = ""):
@@ -18,7 +291,10 @@ class PersonalityDataCreator :
             "character": self.character_name
 
         }
+        if self.writer is not None:
+            return self.writer.add(example)
         self.training_examples.append(example)
+        return True
     
     def create_chilled_out_data(self):
         """Create training data for a chill, self-aware AI with a realistic personality"""
@@ -87,14 +363,143 @@ class PersonalityDataCreator :
 
                 )
     
+    def generate_synthetic_data(self, seed_prompts: List[str], personality_traits: List[str],
+                                examples_per_seed: int = 4, n_parallel: int = 4, model_path: Optional[str] = None,
+                                generation_params: Optional[Dict] = None, report_every: int = 100) -> Dict:
+        """
+        Generate example pairs with the local GGUF model: every seed prompt is
+        rewritten examples_per_seed times, each time with a reply showing one
+        of the traits.
+
+        With n_parallel > 1 the jobs run as parallel sequences of the
+        ModelManager's batched engine (one set of weights, one decode loop);
+        with 1 they run one after another on the model. Each job uses its
+        index as the sampling seed, so reruns reproduce it.
+
+        With output_dir, finished job ids are appended to
+        generation_progress.txt after their example is written, and a rerun
+        with the same arguments skips them; a job that finished after its
+        example was written but before its id was recorded reproduces the
+        same example, which the writer drops as a duplicate. Jobs whose answer
+        couldn't be parsed are not recorded, so they are retried.
+        """
+        from model.model_manager import DEFAULT_MODEL_PATH, ModelManager
+
+        if not seed_prompts or not personality_traits:
+            raise ValueError("Need at least one seed prompt and one trait")
+
+        manager = ModelManager()
+        if manager.model is None:
+            manager.load_model(model_path or DEFAULT_MODEL_PATH)
+        backend = manager.get_batched_engine(n_parallel=n_parallel) if n_parallel > 1 else manager.model
+
+        params = {"temperature": 0.9, "top_p": 0.95, "max_tokens": 200, "repeat_penalty": 1.1}
+        params.update(generation_params or {})
+        system_prompt = GENERATION_SYSTEM_PROMPT.format(name=self.character_name, traits=", ".join(personality_traits))
+
+        # Job i is seed i // examples_per_seed; traits rotate so each seed gets a spread of them
+        total = len(seed_prompts) * examples_per_seed
+        done = set()
+        progress = None
+        if self.writer is not None:
+            progress_path = os.path.join(self.writer.directory, PROGRESS_FILE)
+            if os.path.exists(progress_path):
+                with open(progress_path, "r", encoding="utf-8") as f:
+                    done = {int(line) for line in f if line.strip().isdigit()}
+            progress = open(progress_path, "a", encoding="utf-8")
+
+        def generate(job: int) -> Optional[Dict]:
+            seed = seed_prompts[job // examples_per_seed]
+            trait = personality_traits[job % len(personality_traits)]
+            response = backend.create_chat_completion(
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": GENERATION_USER_PROMPT.format(name=self.character_name, seed=seed,
+                                                                              trait=trait)}
+                ],
+                seed=job,
+                **params
+            )
+            return parse_generated_pair(response["choices"][0]["message"]["content"])
+
+        stats = {"jobs": total, "skipped": len(done), "examples": 0, "duplicates": 0, "failed": 0}
+        pending_jobs = (job for job in range(total) if job not in done)
+        start = time.perf_counter()
+        finished = 0
+
+        executor = ThreadPoolExecutor(max_workers=n_parallel, thread_name_prefix="data-generation")
+        try:
+            # A bounded window of jobs in flight, so millions of jobs don't become millions of futures
+            in_flight = {}
+            while True:
+                while len(in_flight) < n_parallel * 2:
+                    job = next(pending_jobs, None)
+                    if job is None:
+                        break
+                    in_flight[executor.submit(generate, job)] = job
+                if not in_flight:
+                    break
+
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    job = in_flight.pop(future)
+                    try:
+                        pair = future.result()
+                    except Exception as e:
+                        print(f"generation job {job} failed: {e}")
+                        pair = None
+
+                    if pair is None:
+                        stats["failed"] += 1
+                    elif self.add_conversation_example(pair["user"], pair["reply"]):
+                        stats["examples"] += 1
+                    else:
+                        stats["duplicates"] += 1
+
+                    if progress is not None and pair is not None:
+                        # The example must be durable before the job counts as done
+                        self.writer.flush()
+                        progress.write(f"{job}\n")
+                        progress.flush()
+
+                    finished += 1
+                    if finished % report_every == 0:
+                        minutes = (time.perf_counter() - start) / 60
+                        print(f"{finished + len(done)}/{total} jobs, "
+                              f"{stats['examples'] / minutes:.1f} examples/min")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            if progress is not None:
+                progress.close()
+            if self.writer is not None:
+                self.writer.write_manifest()
+
+        minutes = (time.perf_counter() - start) / 60
+        stats["examples_per_minute"] = stats["examples"] / minutes if minutes else 0.0
+        print(f"generated {stats['examples']} examples ({stats['duplicates']} duplicates, {stats['failed']} failed) "
+              f"at {stats['examples_per_minute']:.1f} examples/min")
+        return stats
+
     def save_training_data(self,filename = "training_data.json"):
-        """Save the training data to a JSON file"""
+        """Save the training data to a JSON file (with output_dir: finish the shards and write the manifest)"""
+        if self.writer is not None:
+            self.writer.close()
+            print(f"saved {self.writer.examples} examples in {len(self.writer.shards)} shards to "
+                  f"{self.writer.directory} (dropped {self.writer.exact_duplicates} exact and "
+                  f"{self.writer.near_duplicates} near duplicates)")
+            return
+
         with open(filename,'w',encoding = 'utf-8') as f:
             json.dump(self.training_examples, f,indent = 2, ensure_ascii=False)
         
         print(f"saved {len(self.training_examples)} examples to {filename}")
      
-    def create_dataset (self):
+    def create_dataset (self, streaming: bool = False):
+        if self.writer is not None:
+            self.writer.close()
+            return load_manifest_dataset(self.writer.directory, streaming=streaming)
+
+        from datasets import Dataset
         return Dataset.from_list(self.training_examples)
     
 #usage example
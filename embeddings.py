@@ -0,0 +1,45 @@
+import re
+import zlib
+from typing import List
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+
+class HashingEmbedder:
+    """
+    Dependency-free text embedder using the hashing trick.
+
+    Words and character trigrams are hashed into a fixed number of signed
+    buckets and the result is L2-normalized, so a dot product is cosine
+    similarity. It has no notion of meaning, but it scores reworded small
+    talk ("how are you" / "how r u doing") close together, costs microseconds,
+    and needs no model weights. Anything with the same embed/embed_batch
+    methods can be used in its place.
+    """
+
+    def __init__(self, dim: int = 256, trigram_weight: float = 0.5):
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+
+    def _add(self, vector: np.ndarray, feature: str, weight: float):
+        h = zlib.crc32(feature.encode("utf-8"))
+        # One hash bit picks the sign, so unrelated features cancel out instead of piling up
+        vector[h % self.dim] += weight if h & 0x80000000 else -weight
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in TOKEN_PATTERN.findall(text.lower()):
+            self._add(vector, f"w:{word}", 1.0)
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                self._add(vector, padded[i:i + 3], self.trigram_weight)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
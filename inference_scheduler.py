@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+
+class SchedulerBusy(Exception):
+    """Raised when the admission queue is full"""
+
+
+class GenerationCancelled(Exception):
+    """Raised for queued jobs aborted before they reached the model"""
+
+
+@dataclass(eq=False)
+class InferenceJob:
+    client_id: str
+    fn: Callable[[threading.Event], Any]
+    future: asyncio.Future
+    cancel_event: threading.Event
+    on_position: Optional[Callable[[int], Awaitable]] = None
+    enqueued_at: float = field(default_factory=time.time)
+    last_position: int = 0
+
+
+class InferenceScheduler:
+    """
+    Single admission point in front of the (non thread-safe) Llama model.
+
+    Jobs are plain callables taking a cancel event; they run on a dedicated
+    pool sized to max_in_flight. Waiting jobs are served round-robin across
+    clients, so one chatty client can't starve the others.
+    """
+
+    def __init__(self, max_in_flight: int = 1, max_queue: int = 64, max_per_client: int = 4):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="inference")
+        self._queues: "OrderedDict[str, Deque[InferenceJob]]" = OrderedDict()
+        self._running: Dict[str, Set[InferenceJob]] = {}
+        self._queued = 0
+
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._work_available: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _ensure_started(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._work_available = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(jobs) for jobs in self._running.values())
+
+    async def submit(self, client_id: str, fn: Callable[[threading.Event], Any],
+                     cancel_event: Optional[threading.Event] = None,
+                     on_position: Optional[Callable[[int], Awaitable]] = None) -> Any:
+        """Queue a job for the model and wait for its result"""
+        self._ensure_started()
+
+        if self._queued >= self.max_queue:
+            raise SchedulerBusy("Inference queue is full")
+        client_queue = self._queues.get(client_id)
+        if client_queue is not None and len(client_queue) >= self.max_per_client:
+            raise SchedulerBusy("Too many pending requests for this client")
+
+        job = InferenceJob(
+            client_id=client_id,
+            fn=fn,
+            future=asyncio.get_event_loop().create_future(),
+            cancel_event=cancel_event or threading.Event(),
+            on_position=on_position
+        )
+
+        if client_queue is None:
+            client_queue = self._queues[client_id] = deque()
+        client_queue.append(job)
+        self._queued += 1
+        self._work_available.set()
+        self._notify_positions()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            job.cancel_event.set()
+            self._remove_queued(job)
+            raise
+
+    def cancel(self, client_id: str) -> int:
+        """Abort every queued and running job of a client; returns how many were hit"""
+        cancelled = 0
+
+        for job in self._queues.pop(client_id, ()):
+            self._queued -= 1
+            job.cancel_event.set()
+            if not job.future.done():
+                job.future.set_exception(GenerationCancelled(f"Generation cancelled for {client_id}"))
+            cancelled += 1
+
+        for job in self._running.get(client_id, ()):
+            # Running jobs poll their cancel event between tokens
+            job.cancel_event.set()
+            cancelled += 1
+
+        if cancelled:
+            self._notify_positions()
+        return cancelled
+
+    def _remove_queued(self, job: InferenceJob):
+        client_queue = self._queues.get(job.client_id)
+        if client_queue and job in client_queue:
+            client_queue.remove(job)
+            self._queued -= 1
+            if not client_queue:
+                del self._queues[job.client_id]
+            self._notify_positions()
+
+    def _next_job(self) -> Optional[InferenceJob]:
+        """Pop the head job of the next client in round-robin order"""
+        while self._queues:
+            client_id, client_queue = next(iter(self._queues.items()))
+            del self._queues[client_id]
+            if not client_queue:
+                continue
+            job = client_queue.popleft()
+            self._queued -= 1
+            if client_queue:
+                self._queues[client_id] = client_queue  # back of the line
+            return job
+        return None
+
+    def _fair_order(self) -> List[InferenceJob]:
+        order = []
+        queues = [list(q) for q in self._queues.values()]
+        depth = 0
+        while True:
+            row = [q[depth] for q in queues if depth < len(q)]
+            if not row:
+                return order
+            order.extend(row)
+            depth += 1
+
+    def _notify_positions(self):
+        for position, job in enumerate(self._fair_order(), start=1):
+            if job.on_position and job.last_position != position:
+                job.last_position = position
+                asyncio.ensure_future(job.on_position(position))
+
+    async def _dispatch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await self._slots.acquire()
+
+            job = self._next_job()
+            while job is None:
+                self._work_available.clear()
+                await self._work_available.wait()
+                job = self._next_job()
+
+            if job.future.done():
+                self._slots.release()
+                continue
+
+            self._running.setdefault(job.client_id, set()).add(job)
+            self._notify_positions()
+
+            execution = loop.run_in_executor(self._executor, job.fn, job.cancel_event)
+            execution.add_done_callback(lambda result, job=job: self._finish(job, result))
+
+    def _finish(self, job: InferenceJob, result: asyncio.Future):
+        running = self._running.get(job.client_id)
+        if running is not None:
+            running.discard(job)
+            if not running:
+                del self._running[job.client_id]
+        self._slots.release()
+
+        if job.future.done():
+            return
+        if result.exception() is not None:
+            job.future.set_exception(result.exception())
+        else:
+            job.future.set_result(result.result())
+
+    def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+        for client_id in list(self._queues):
+            self.cancel(client_id)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class SessionStateCache:
+    """
+    LRU cache of llama.cpp context states keyed by session id.
+
+    Restoring a session's state before its next turn puts its KV cache and
+    input ids back into the model, so llama_cpp's prefix matching only has to
+    evaluate the tokens added since the previous reply.
+
+    A turn only claims the context; the state is copied out when another
+    session (or an unrelated call) takes the context over, so a session that
+    keeps the model to itself never pays for a save.
+    """
+
+    def __init__(self, capacity_bytes: int = 2 << 30):
+        self.capacity_bytes = capacity_bytes
+        self.states: "OrderedDict[str, object]" = OrderedDict()
+        self.size_bytes = 0
+
+        # Session whose state is currently live in each model's context
+        self._active: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _state_size(state) -> int:
+        size = getattr(state, "llama_state_size", None) or len(getattr(state, "llama_state", b""))
+        # Saved logits are one n_vocab row per token; big for models loaded with logits_all
+        scores = getattr(state, "scores", None)
+        return size + (scores.nbytes if scores is not None else 0)
+
+    def save(self, session_id: str, model):
+        """Capture the model's current state for a session, evicting old states over budget"""
+        state = model.save_state()
+        size = self._state_size(state)
+
+        with self._lock:
+            self._discard(session_id)
+
+            if size > self.capacity_bytes:
+                return
+
+            self.states[session_id] = state
+            self.size_bytes += size
+
+            while self.size_bytes > self.capacity_bytes and self.states:
+                _, evicted = self.states.popitem(last=False)
+                self.size_bytes -= self._state_size(evicted)
+
+    def claim(self, session_id: str, model):
+        """Record that the model's context holds a session's conversation after its turn"""
+        with self._lock:
+            self._active[id(model)] = session_id
+
+    def hand_over(self, model, session_id: Optional[str] = None):
+        """
+        Call before session_id (None for an unrelated call) uses the model's
+        context: saves the state of the session that used it last
+        """
+        with self._lock:
+            owner = self._active.get(id(model))
+            if owner is None or owner == session_id:
+                return
+            del self._active[id(model)]
+        self.save(owner, model)
+
+    def restore(self, session_id: str, model) -> bool:
+        """Load a session's saved state into the model (after hand_over); returns False on a cache miss"""
+        with self._lock:
+            if self._active.get(id(model)) == session_id:
+                # Nobody else has used the context since this session's last turn
+                self.hits += 1
+                return True
+
+            state = self.states.get(session_id)
+            if state is None:
+                self.misses += 1
+                return False
+
+            self.states.move_to_end(session_id)
+            self.hits += 1
+
+        model.load_state(state)
+        with self._lock:
+            self._active[id(model)] = session_id
+        return True
+
+    def _discard(self, session_id: str):
+        state = self.states.pop(session_id, None)
+        if state is not None:
+            self.size_bytes -= self._state_size(state)
+
+    def discard(self, session_id: str):
+        """Drop a key, plus any "<session_id>|<model>" keys belonging to that session"""
+        def matches(key):
+            return key == session_id or key.startswith(f"{session_id}|")
+
+        with self._lock:
+            for key in [k for k in self.states if matches(k)]:
+                self._discard(key)
+            for model_id, active in list(self._active.items()):
+                if matches(active):
+                    del self._active[model_id]
+
+    def stats(self) -> Dict:
+        return {
+            "states": len(self.states),
+            "size_bytes": self.size_bytes,
+            "capacity_bytes": self.capacity_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from ai_core.embeddings import HashingEmbedder
+
+
+@dataclass
+class Memory:
+    row: int
+    session_id: str
+    text: str
+    timestamp: float
+    score: float = 0.0
+
+
+class LongTermMemory:
+    """
+    Append-only store of past exchanges with vector search.
+
+    Embeddings live in a float32 file mapped with np.memmap (vectors.f32), so
+    the OS pages it in on demand and the process never holds months of
+    history in RAM. Metadata is a JSON-lines file (memories.jsonl); only each
+    row's byte offset and timestamp, plus each session's row numbers, are
+    kept in memory, and text is read back just for the rows a search returns.
+    A search within one session only reads and scores that session's rows.
+
+    A row counts once its metadata line is written, so a crash between the two
+    appends leaves an unused vector slot rather than a corrupt index.
+    """
+
+    def __init__(self, directory: str = "memory_store", embedder=None, initial_capacity: int = 4096,
+                 search_block_rows: int = 65536):
+        self.directory = directory
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        self.search_block_rows = search_block_rows
+
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.metadata_path = os.path.join(directory, "memories.jsonl")
+
+        self._lock = threading.Lock()
+        self.offsets: List[int] = []
+        self._session_ids = {}  # session id -> small int indexing the per-session row lists
+        self._session_names: List[str] = []
+        self._session_rows: List[np.ndarray] = []  # Rows of each session, ascending; grown by doubling
+        self._session_counts: List[int] = []
+
+        timestamps, sessions = self._load_metadata()
+        self._open_vectors(max(initial_capacity, len(self.offsets)))
+        # Per-row timestamps used as a search filter, sized like the vector file
+        self.row_timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.row_timestamps[:len(timestamps)] = timestamps
+        self._index_sessions(np.asarray(sessions, dtype=np.int64))
+        self._metadata_file = open(self.metadata_path, "ab")
+
+    @property
+    def count(self) -> int:
+        return len(self.offsets)
+
+    def _session_index(self, session_id: str) -> int:
+        index = self._session_ids.get(session_id)
+        if index is None:
+            index = self._session_ids[session_id] = len(self._session_names)
+            self._session_names.append(session_id)
+            self._session_rows.append(np.zeros(4, dtype=np.int64))
+            self._session_counts.append(0)
+        return index
+
+    def _index_sessions(self, sessions: np.ndarray):
+        """Fill the per-session row lists from each loaded row's session index"""
+        order = np.argsort(sessions, kind="stable")
+        bounds = np.searchsorted(sessions[order], np.arange(len(self._session_names) + 1))
+        for index in range(len(self._session_names)):
+            rows = order[bounds[index]:bounds[index + 1]]
+            self._session_rows[index] = np.resize(rows, max(4, 2 * len(rows)))
+            self._session_counts[index] = len(rows)
+
+    def _append_session_row(self, index: int, row: int):
+        count = self._session_counts[index]
+        if count == len(self._session_rows[index]):
+            # A new array, so rows handed to a running search stay valid
+            self._session_rows[index] = np.resize(self._session_rows[index], 2 * count)
+        self._session_rows[index][count] = row
+        self._session_counts[index] = count + 1
+
+    def _load_metadata(self):
+        timestamps, sessions = [], []
+        if not os.path.exists(self.metadata_path):
+            return timestamps, sessions
+
+        offset = 0
+        with open(self.metadata_path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.offsets.append(offset)
+                timestamps.append(record["timestamp"])
+                sessions.append(self._session_index(record["session_id"]))
+                offset += len(line)
+
+        if offset != os.path.getsize(self.metadata_path):
+            # Torn last line from a crash; drop it so new appends stay readable
+            with open(self.metadata_path, "r+b") as f:
+                f.truncate(offset)
+        return timestamps, sessions
+
+    def _open_vectors(self, capacity: int):
+        size = capacity * self.dim * 4
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self.capacity = os.path.getsize(self.vectors_path) // (self.dim * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def add(self, session_id: str, text: str, timestamp: Optional[float] = None,
+            embed_text: Optional[str] = None) -> int:
+        """Append one memory, indexed by embed_text when given (e.g. just the user's side); returns its row"""
+        vector = self.embedder.embed(embed_text or text)
+        timestamp = timestamp or time.time()
+        line = (json.dumps({"session_id": session_id, "text": text, "timestamp": timestamp}) + "\n").encode("utf-8")
+
+        with self._lock:
+            row = self.count
+            if row >= self.capacity:
+                self.vectors.flush()
+                del self.vectors
+                self._open_vectors(self.capacity * 2)
+                self.row_timestamps = np.resize(self.row_timestamps, self.capacity)
+            self.vectors[row] = vector
+            self.row_timestamps[row] = timestamp
+            self._append_session_row(self._session_index(session_id), row)
+
+            offset = self._metadata_file.seek(0, os.SEEK_END)
+            self._metadata_file.write(line)
+            self._metadata_file.flush()
+
+            self.offsets.append(offset)
+            return row
+
+    def search(self, query: str, session_id: Optional[str] = None, k: int = 4, min_score: float = 0.0,
+               before: Optional[float] = None) -> List[Memory]:
+        return self.search_batch([query], session_id=session_id, k=k, min_score=min_score, before=before)[0]
+
+    def search_batch(self, queries: Sequence[str], session_id: Optional[str] = None, k: int = 4,
+                     min_score: float = 0.0, before: Optional[float] = None) -> List[List[Memory]]:
+        """
+        Top-k memories for each query, optionally limited to one session and
+        to memories written before a timestamp. Rows are scored block by block
+        with one matrix product per block, keeping a running top-k. Blocking;
+        call it from a worker thread on a server.
+        """
+        if not queries:
+            return []
+        query_vectors = self.embedder.embed_batch(list(queries))
+
+        with self._lock:
+            n = self.count
+            vectors, row_timestamps = self.vectors, self.row_timestamps
+            session_index = self._session_ids.get(session_id) if session_id is not None else None
+            if session_index is not None:
+                session_rows = self._session_rows[session_index][:self._session_counts[session_index]]
+        if n == 0 or (session_id is not None and session_index is None):
+            return [[] for _ in queries]
+
+        size = self.search_block_rows
+        if session_index is not None:
+            if before is not None:
+                session_rows = session_rows[row_timestamps[session_rows] < before]
+            blocks = ((session_rows[i:i + size], vectors[session_rows[i:i + size]])
+                      for i in range(0, len(session_rows), size))
+        else:
+            blocks = ((np.arange(start, min(start + size, n)), vectors[start:min(start + size, n)])
+                      for start in range(0, n, size))
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+
+        for block_rows, block_vectors in blocks:
+            scores = query_vectors @ block_vectors.T  # (queries, block)
+            if before is not None and session_index is None:
+                scores[:, row_timestamps[block_rows] >= before] = -np.inf
+
+            rows = np.broadcast_to(block_rows, scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            memories = [self._read(int(rows[i]), float(scores[i]))
+                        for i in order if np.isfinite(scores[i]) and scores[i] >= min_score]
+            results.append(memories)
+        return results
+
+    def _read(self, row: int, score: float) -> Memory:
+        with open(self.metadata_path, "rb") as f:
+            f.seek(self.offsets[row])
+            record = json.loads(f.readline())
+        return Memory(row=row, session_id=record["session_id"], text=record["text"],
+                      timestamp=record["timestamp"], score=score)
+
+    def close(self):
+        with self._lock:
+            self.vectors.flush()
+            self._metadata_file.close()
@@ -0,0 +1,250 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from model.model_manager import model_lock
+# llama_cpp is imported where it is used, so importing this module stays fast
+
+logger = logging.getLogger(__name__)
+
+ADAPTER_DIR = "adapters"
+LLAMA_CPP_DIR = os.environ.get("LLAMA_CPP_DIR", "llama.cpp")  # llama.cpp checkout with convert_lora_to_gguf.py
+
+
+@dataclass
+class RegisteredAdapter:
+    name: str
+    path: str
+    scale: float = 1.0
+
+
+@dataclass
+class _LoRAApi:
+    init: object
+    set: object
+    clear: object
+    free: object
+
+
+def _lora_api() -> _LoRAApi:
+    """The llama.cpp adapter functions, which were renamed in newer llama-cpp-python releases"""
+    import llama_cpp
+
+    if hasattr(llama_cpp, "llama_adapter_lora_init"):
+        return _LoRAApi(llama_cpp.llama_adapter_lora_init, llama_cpp.llama_set_adapter_lora,
+                        llama_cpp.llama_clear_adapter_lora, llama_cpp.llama_adapter_lora_free)
+    if hasattr(llama_cpp, "llama_lora_adapter_init"):
+        return _LoRAApi(llama_cpp.llama_lora_adapter_init, llama_cpp.llama_lora_adapter_set,
+                        llama_cpp.llama_lora_adapter_clear, llama_cpp.llama_lora_adapter_free)
+    raise RuntimeError("This llama-cpp-python build has no LoRA adapter API; upgrade llama-cpp-python")
+
+
+class _AdapterTurn:
+    """Holds a model's context for one generation with the requested adapter set"""
+
+    __slots__ = ("manager", "model", "name", "lock")
+
+    def __init__(self, manager: "LoRAAdapterManager", model, name: Optional[str]):
+        self.manager = manager
+        self.model = model
+        self.name = name
+        self.lock = manager._model_lock(model)  # Re-entrant, so callers may already hold it
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.manager._activate(self.model, self.name)
+        except BaseException:
+            self.lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.lock.release()
+        return False
+
+
+class LoRAAdapterManager:
+    """
+    GGUF LoRA adapters applied on top of shared, already loaded base models.
+
+    An adapter is loaded once per base model (a few MB to a few hundred MB,
+    against GBs for another copy of the weights) and set on the model's
+    llama.cpp context for the turns that use it. Switching is cheap, but it
+    drops the context's token history so prefix matching can't reuse KV
+    entries computed under another adapter; session states saved per adapter
+    still restore normally.
+
+    Adapters are set per context, so use() holds the model's model_lock and
+    generations on the same model run one at a time. The batched engine has its own context and
+    only serves the base model.
+    """
+
+    def __init__(self, directory: str = ADAPTER_DIR, max_loaded: int = 16):
+        self.directory = directory
+        self.max_loaded = max_loaded
+        self.adapters: Dict[str, RegisteredAdapter] = {}
+
+        self.loaded: "OrderedDict[tuple, object]" = OrderedDict()  # (model id, adapter) -> handle, LRU first
+        self.active: Dict[int, Optional[str]] = {}  # model id -> adapter currently set on its context
+        self._tracked = set()  # ids of models whose handles are forgotten when they are freed
+        self._lock = threading.Lock()
+        self._api = None
+        self.switches = 0
+
+        if os.path.isdir(directory):
+            self.register_directory(directory)
+
+    def register(self, name: str, path: str, scale: float = 1.0) -> RegisteredAdapter:
+        """Make a GGUF adapter available under a name; it is loaded onto a model on first use"""
+        with self._lock:
+            previous = self.adapters.get(name)
+            if previous is not None and previous.path != path:
+                # Handles of the old file are never set again; llama.cpp frees them with their model
+                for key in [key for key in self.loaded if key[1] == name]:
+                    del self.loaded[key]
+                for model_id, active in list(self.active.items()):
+                    if active == name:
+                        del self.active[model_id]  # Switch to the new file on next use
+            adapter = self.adapters[name] = RegisteredAdapter(name=name, path=path, scale=scale)
+            return adapter
+
+    def register_directory(self, directory: str):
+        """Register every <name>.gguf in a directory as adapter <name>"""
+        for path in sorted(glob.glob(os.path.join(directory, "*.gguf"))):
+            self.register(os.path.splitext(os.path.basename(path))[0], path)
+
+    def names(self) -> List[str]:
+        return list(self.adapters)
+
+    def use(self, model, name: Optional[str]) -> _AdapterTurn:
+        """Context manager running one generation on model with adapter `name` (None = base model)"""
+        if name is not None and name not in self.adapters:
+            raise ValueError(f"Unknown LoRA adapter: {name}")
+        return _AdapterTurn(self, model, name)
+
+    def _model_lock(self, model) -> threading.RLock:
+        with self._lock:
+            if id(model) not in self._tracked:
+                self._tracked.add(id(model))
+                # llama.cpp frees a model's adapters with the model; forget the handles with it
+                weakref.finalize(model, self._forget, id(model))
+        return model_lock(model)
+
+    def _forget(self, model_id: int):
+        with self._lock:
+            for key in [key for key in self.loaded if key[0] == model_id]:
+                del self.loaded[key]
+            self.active.pop(model_id, None)
+            self._tracked.discard(model_id)
+
+    def _handle(self, model, name: str):
+        key = (id(model), name)
+        with self._lock:
+            handle = self.loaded.get(key)
+            if handle is not None:
+                self.loaded.move_to_end(key)
+                return handle
+            adapter = self.adapters[name]
+
+        logger.info(f"Loading LoRA adapter '{name}' from {adapter.path}")
+        handle = self._api.init(model.model, adapter.path.encode("utf-8"))
+        if not handle:
+            raise RuntimeError(f"Failed to load LoRA adapter '{name}' from {adapter.path} "
+                               f"(is it a GGUF adapter for this base model?)")
+
+        with self._lock:
+            self.loaded[key] = handle
+            # Evict least recently used handles that no context has set
+            active = {(model_id, active_name) for model_id, active_name in self.active.items()}
+            for old_key in list(self.loaded):
+                if len(self.loaded) <= self.max_loaded:
+                    break
+                if old_key != key and old_key not in active:
+                    self._api.free(self.loaded.pop(old_key))
+        return handle
+
+    def _activate(self, model, name: Optional[str]):
+        """Set adapter `name` on the model's context if it isn't already (caller holds the model lock)"""
+        if id(model) in self.active and self.active[id(model)] == name:
+            return
+        if self._api is None:
+            self._api = _lora_api()
+
+        ctx = model.ctx
+        self._api.clear(ctx)
+        with self._lock:
+            self.active.pop(id(model), None)  # The previous adapter is no longer set, so it may be evicted
+        if name is not None:
+            handle = self._handle(model, name)
+            if self._api.set(ctx, handle, self.adapters[name].scale) != 0:
+                raise RuntimeError(f"Failed to set LoRA adapter '{name}'")
+        model.reset()  # The cached tokens were evaluated under the previous adapter
+        with self._lock:
+            self.active[id(model)] = name
+            self.switches += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "registered": len(self.adapters),
+                "loaded": len(self.loaded),
+                "loaded_bytes": sum(os.path.getsize(self.adapters[name].path)
+                                    for _, name in self.loaded if name in self.adapters
+                                    and os.path.exists(self.adapters[name].path)),
+                "switches": self.switches
+            }
+
+
+def convert_peft_adapter(peft_dir: str, output_path: Optional[str] = None, base_model_dir: Optional[str] = None,
+                         outtype: str = "f16", llama_cpp_dir: str = LLAMA_CPP_DIR) -> str:
+    """
+    Convert a PEFT LoRA output directory (adapter_config.json +
+    adapter_model.safetensors) to a GGUF adapter with llama.cpp's
+    convert_lora_to_gguf.py. The script needs the base model's HF config:
+    from base_model_dir if given, otherwise fetched for the adapter's
+    base_model_name_or_path. Returns the GGUF path (adapters/<dir name>.gguf
+    by default), ready for LoRAAdapterManager.
+    """
+    script = os.path.join(llama_cpp_dir, "convert_lora_to_gguf.py")
+    if not os.path.exists(script):
+        raise FileNotFoundError(f"{script} not found; clone llama.cpp and set LLAMA_CPP_DIR to it")
+
+    with open(os.path.join(peft_dir, "adapter_config.json"), "r", encoding="utf-8") as f:
+        adapter_config = json.load(f)
+
+    if output_path is None:
+        os.makedirs(ADAPTER_DIR, exist_ok=True)
+        output_path = os.path.join(ADAPTER_DIR, os.path.basename(os.path.normpath(peft_dir)) + ".gguf")
+
+    command = [sys.executable, script, "--outfile", output_path, "--outtype", outtype]
+    if base_model_dir:
+        command += ["--base", base_model_dir]
+    elif adapter_config.get("base_model_name_or_path"):
+        command += ["--base-model-id", adapter_config["base_model_name_or_path"]]
+    command.append(peft_dir)
+
+    print(f"Converting LoRA adapter {peft_dir} -> {output_path}...")
+    subprocess.run(command, check=True)
+    print(f"Adapter written to {output_path}")
+    return output_path
+
+
+# Example usage: python lora_adapters.py ./openllama_lora --base ./models/hf-base
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a PEFT LoRA directory to a GGUF adapter")
+    parser.add_argument("peft_dir")
+    parser.add_argument("--base", help="local HF directory of the base model (config and tokenizer)")
+    parser.add_argument("--outfile", help=f"output path (default: {ADAPTER_DIR}/<peft dir name>.gguf)")
+    parser.add_argument("--outtype", default="f16", choices=["f32", "f16", "bf16", "q8_0"])
+    args = parser.parse_args()
+    convert_peft_adapter(args.peft_dir, output_path=args.outfile, base_model_dir=args.base, outtype=args.outtype)
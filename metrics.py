@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds: sub-millisecond JSON work up to multi-second generations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], object]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        # Pull-based metrics read their value(s) at scrape time: a number, or {label tuple: number}
+        self.function = function
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Dict[Tuple[str, ...], float]:
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        if isinstance(value, dict):
+            return {key if isinstance(key, tuple) else (key,): v for key, v in value.items()}
+        return {(): value}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class _Timer:
+    """Context manager observing elapsed seconds (a plain class is cheaper than @contextmanager)"""
+
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Histogram(_Metric):
+    """
+    Fixed-bucket histogram. Observing is a bisect plus a few additions under a
+    lock, cheap enough for every token batch. p50/p95/p99 are estimated from
+    the buckets the same way Prometheus' histogram_quantile() does, and are
+    also exported as a <name>_quantile gauge for dashboards without PromQL.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            if series is None:
+                return None
+            return self._quantile(series, q)
+
+    def _quantile(self, series: List, q: float) -> Optional[float]:
+        counts = series[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]  # Beyond the last bucket; report its bound
+                lower = self.buckets[i - 1] if i else 0.0
+                fraction = (rank - cumulative) / count if count else 0.0
+                return lower + (self.buckets[i] - lower) * fraction
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [f"# HELP {self.name}_quantile Estimated quantiles of {self.name}",
+                          f"# TYPE {self.name}_quantile gauge"]
+        with self._lock:
+            series_items = sorted((key, list(series)) for key, series in self._series.items())
+
+        for key, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+            for q in QUANTILES:
+                quantile_labels = _format_labels(self.labelnames, key, 'quantile="%s"' % q)
+                quantile_lines.append(f"{self.name}_quantile{quantile_labels} {self._quantile(series, q)}")
+
+        return lines + (quantile_lines if series_items else [])
+
+
+class MetricsRegistry:
+    """Process-wide metric set; get-or-create so modules can declare the metrics they use"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def _with_function(self, cls, name: str, help_text: str, labelnames: Sequence[str], function):
+        metric = self._get_or_create(cls, name, help_text, labelnames)
+        if function is not None:
+            # Re-registering (e.g. a restarted server) points the metric at the new source
+            metric.function = function
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = (), function=None) -> Counter:
+        return self._with_function(Counter, name, help_text, labelnames, function)
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = (), function=None) -> Gauge:
+        return self._with_function(Gauge, name, help_text, labelnames, function)
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A broken pull function shouldn't take down the whole scrape
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Shared metrics used across the server, brain and audio modules
+stage_seconds = registry.histogram(
+    "anya_stage_seconds",
+    "Time spent per turn stage (json_parse, stt, queue_wait, prompt_eval, decode, tts, send, turn)",
+    ["stage"]
+)
+tokens_per_second = registry.histogram(
+    "anya_decode_tokens_per_second",
+    "Decode throughput per generation",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250, 500)
+)
+generated_tokens = registry.counter("anya_generated_tokens_total", "Tokens streamed back to clients")
@@ -1,10 +1,48 @@
-from llama_cpp import Llama
-from huggingface_hub import hf_hub_download
-from transformers import AutoTokenizer  # For HF tokenizer
+import json
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+# llama_cpp, huggingface_hub and transformers are imported where they are used,
+# so importing this module (and the server) stays fast
 #2104
+DEFAULT_MODEL_REPO = "bartowski/Qwen2.5-14B-Instruct-GGUF"
+DEFAULT_MODEL_FILE = "Qwen2.5-14B-Instruct-IQ2_M.gguf"
+DEFAULT_MODEL_PATH = os.path.join("models", DEFAULT_MODEL_FILE)
+DEFAULT_MODEL_NAME = "default"
+
+_model_locks: Dict[int, threading.RLock] = {}
+_model_locks_guard = threading.Lock()
+
+
+def model_lock(model) -> threading.RLock:
+    """
+    The lock every generation on a llama_cpp.Llama must hold: a Llama has one
+    context, so only the batched engine may decode for several sessions at once.
+    """
+    with _model_locks_guard:
+        lock = _model_locks.get(id(model))
+        if lock is None:
+            lock = _model_locks[id(model)] = threading.RLock()
+            weakref.finalize(model, _model_locks.pop, id(model), None)
+        return lock
+
+
+@dataclass
+class RegisteredModel:
+    name: str
+    path: str
+    load_params: Dict = field(default_factory=dict)
+    model: object = None
+    size_bytes: int = 0
+    last_used: float = 0.0
+
+
 class ModelManager:
-    _instance = None  
+    _instance = None
 
     def __new__(cls):
         if cls._instance is None:
@@ -13,9 +51,16 @@ class ModelManager:
             cls._instance.tokenizer = None
             cls._instance.model_path = None
             cls._instance.model_name = None
+            cls._instance.batched_engine = None
+
+            # Registry of GGUF models that can be loaded side by side, least recently used first
+            cls._instance.registry = OrderedDict()
+            cls._instance.default_model_name = None
+            cls._instance.memory_budget_bytes = int(os.environ.get("ANYA_MODEL_MEMORY_BYTES", 0))  # 0 = unlimited
+            cls._instance._registry_lock = threading.RLock()
         return cls._instance
 
-    def download_model(self, model_name="bartowski/Qwen2.5-14B-Instruct-GGUF"):
+    def download_model(self, model_name=DEFAULT_MODEL_REPO, filename=DEFAULT_MODEL_FILE):
         """Download and cache model locally"""
         self.model_name = model_name
 
@@ -24,59 +69,175 @@ class ModelManager:
             return self.model_path
 
         print("Downloading model (this may take 10-20 minutes first time)...")
+        from huggingface_hub import hf_hub_download
 
+        # local_dir puts the file at models/<filename>, the same path the server looks for
         model_path = hf_hub_download(
             repo_id=model_name,
-            filename="Qwen2.5-14B-Instruct-Q4_K_M.gguf",
-            cache_dir="./models"
+            filename=filename,
+            local_dir="./models"
         )
 
         self.model_path = model_path
         print(f"Model downloaded to: {model_path}")
         return model_path
 
-    def load_model(self, model_path=None, load_tokenizer=False, hf_tokenizer_name=None):
+    def register_model(self, name: str, path: str, default=False, **load_params) -> RegisteredModel:
+        """Make a GGUF file available under a name; it is loaded on first use"""
+        with self._registry_lock:
+            entry = self.registry.get(name)
+            if entry is None or entry.path != path:
+                if entry is not None:
+                    self.unload_model(name)
+                entry = RegisteredModel(name=name, path=path, load_params=load_params)
+                self.registry[name] = entry
+            if default or self.default_model_name is None:
+                self.default_model_name = name
+            return entry
+
+    def register_models_from_file(self, config_path="models.json"):
+        """
+        Register models from a JSON file such as
+        {"small": {"path": "models/qwen2.5-0.5b-instruct-q4_k_m.gguf", "n_ctx": 2048}}
+        """
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        for name, params in config.items():
+            params = dict(params)
+            self.register_model(name, params.pop("path"), **params)
+
+    def get_model(self, name: Optional[str] = None):
+        """Return a registered model by name, loading it (and evicting others) when needed"""
+        with self._registry_lock:
+            name = name or self.default_model_name
+            entry = self.registry.get(name)
+            if entry is None:
+                raise ValueError(f"Unknown model: {name}")
+
+            entry.last_used = time.time()
+            self.registry.move_to_end(name)
+            if entry.model is not None:
+                return entry.model
+
+            entry.size_bytes = os.path.getsize(entry.path) if os.path.exists(entry.path) else 0
+            self._make_room(entry.size_bytes, keep=name)
+
+            print(f"Loading model '{name}' into memory...")
+            entry.model = self._create_llama(entry.path, **entry.load_params)
+            print(f"Model '{name}' loaded successfully!")
+
+            if name == self.default_model_name:
+                self.model = entry.model
+                self.model_path = entry.path
+            return entry.model
+
+    def unload_model(self, name: str):
+        with self._registry_lock:
+            entry = self.registry.get(name)
+            if entry is None or entry.model is None:
+                return
+            print(f"Unloading model '{name}'...")
+            if self.batched_engine is not None and self.batched_engine.model is entry.model:
+                self.batched_engine.close()
+                self.batched_engine = None
+            if self.model is entry.model:
+                self.model = None
+            # Requests already running keep their reference; memory is freed when they finish
+            entry.model = None
+
+    def loaded_memory(self) -> int:
+        return sum(entry.size_bytes for entry in self.registry.values() if entry.model is not None)
+
+    def _make_room(self, needed_bytes: int, keep: str):
+        if not self.memory_budget_bytes:
+            return
+        for name, entry in list(self.registry.items()):
+            if self.loaded_memory() + needed_bytes <= self.memory_budget_bytes:
+                return
+            if name == keep or entry.model is None:
+                continue
+            # Don't cut off the engine's running generations to make room
+            engine = self.batched_engine
+            if engine is not None and engine.model is entry.model and engine.busy():
+                continue
+            self.unload_model(name)
+
+    def _create_llama(self, model_path, **overrides):
+        from llama_cpp import Llama
+        from model.autotune import default_params, load_profile
+
+        # Host defaults, then the autotuned profile for this model, then explicit arguments
+        params = default_params()
+        profile = load_profile(model_path)
+        if profile:
+            print(f"Using tuned llama.cpp profile: {profile}")
+        params.update(profile)
+        params.update(overrides)
+
+        return Llama(
+            model_path=model_path,
+            verbose=False,
+            chat_format="chatml",
+            **params
+        )
+
+    def load_model(self, model_path=None, load_tokenizer=False, hf_tokenizer_name=None, n_ctx=None, name=None,
+                   speculative=False):
         """
         Load model into memory for inference.
+        Runtime parameters come from the autotune profile (python autotune.py) when one exists.
+        - n_ctx: context size in tokens, overriding the profile; conversation packing fills up to this limit
+        - name: registry name (defaults to "default"); the model becomes the default model
+        - speculative: keep logits for every position so personalities with a "speculative" config can
+          have drafts verified (costs n_ctx * n_vocab floats of RAM and larger saved session states)
         - load_tokenizer: whether to load a HF tokenizer
         - hf_tokenizer_name: HF tokenizer repo name (if different from model)
         """
-        if self.model:
-            print("Model already loaded. Skipping reload.")
-            return self.model
-
         if model_path:
             self.model_path = model_path
 
         if not self.model_path:
             raise ValueError("No model path specified")
 
-        print("Loading model into memory...")
-
-        # Load llama_cpp model
-        self.model = Llama(
-            model_path=self.model_path,
- #old code from old model inused           n_ctx=4096,
-            n_batch=512,
-            n_threads=8,
-            n_gpu_layers=8090, 
-            use_mmap=True,
-            use_mlock=False,
-            verbose=False,
-            chat_format="chatml"
-        )
-
-        print("Model loaded successfully!")
+        name = name or DEFAULT_MODEL_NAME
+        load_params = {"n_ctx": n_ctx} if n_ctx else {}
+        if speculative:
+            load_params["logits_all"] = True
+        self.register_model(name, self.model_path, default=True, **load_params)
+        self.model = self.get_model(name)
 
         # Optionally load HF tokenizer
         if load_tokenizer:
             tokenizer_name = hf_tokenizer_name or self.model_name
             print(f"Loading tokenizer '{tokenizer_name}' from Hugging Face Hub...")
+            from transformers import AutoTokenizer  # For HF tokenizer
             self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
             print("Tokenizer loaded successfully!")
 
         return self.model
 
+    def get_batched_engine(self, n_parallel=4, n_batch=512):
+        """Continuous-batching engine sharing the loaded model's weights"""
+        if not self.model:
+            raise ValueError("Model not loaded")
+
+        if self.batched_engine is None or self.batched_engine.model is not self.model:
+            from model.batched_engine import BatchedGenerationEngine
+            print(f"Starting batched engine with {n_parallel} parallel sequences...")
+            self.batched_engine = BatchedGenerationEngine(self.model, n_parallel=n_parallel, n_batch=n_batch)
+
+        return self.batched_engine
+
+    def warmup(self, max_tokens=4):
+        """Run one short generation so weights are paged in before real traffic"""
+        if not self.model:
+            raise ValueError("Model not loaded")
+        with model_lock(self.model):
+            self.model.create_chat_completion(
+                messages=[{"role": "user", "content": "Hi"}],
+                max_tokens=max_tokens
+            )
+
     def test_model(self):
         """Test the loaded model with a simple query"""
         if not self.model:
@@ -97,7 +258,7 @@ class ModelManager:
 if __name__ == "__main__":
     manager = ModelManager()
     path = manager.download_model()
-    
+
     model = manager.load_model(path, load_tokenizer=False)
     test_response = manager.test_model()
     print(f"Test response: {test_response}")
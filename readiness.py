@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+STARTING = "starting"
+LOADING_MODEL = "loading_model"
+WARMING_UP = "warming_up"
+READY = "ready"
+FAILED = "failed"
+
+
+class Readiness:
+    """Process-wide startup state shared by the WebSocket server and the HTTP app"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.state = STARTING
+        self.detail = ""
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.ready_at: Optional[float] = None
+        self._listeners: List[Callable[[Dict], None]] = []
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == READY
+
+    def set_state(self, state: str, detail: str = "", error: Optional[str] = None):
+        with self._lock:
+            self.state = state
+            self.detail = detail
+            self.error = error
+            if state == READY:
+                self.ready_at = time.time()
+            listeners = list(self._listeners)
+
+        snapshot = self.to_dict()
+        for listener in listeners:
+            listener(snapshot)
+
+    def on_change(self, listener: Callable[[Dict], None]):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == READY,
+                "detail": self.detail,
+                "error": self.error,
+                "uptime": time.time() - self.started_at,
+                "startup_seconds": self.ready_at - self.started_at if self.ready_at else None
+            }
+
+
+readiness = Readiness()
@@ -0,0 +1,203 @@
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from ai_core.embeddings import HashingEmbedder
+
+NORMALIZE_PATTERN = re.compile(r"[^a-z0-9' ]+")
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace: "Hey!!  " -> "hey" """
+    return " ".join(NORMALIZE_PATTERN.sub(" ", text.lower()).split())
+
+
+def context_hash(recent: Sequence[str]) -> str:
+    return hashlib.sha1("\0".join(normalize_message(text) for text in recent).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class CachedReply:
+    namespace: str
+    message: str
+    context: str
+    replies: List[str] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    row: int = -1  # Row of this entry's embedding in its namespace matrix
+
+
+class _NamespaceIndex:
+    """Embeddings of one namespace's entries in a dense matrix for vectorized search"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.contexts: List[str] = []
+        self.keys: List[tuple] = []
+
+    def add(self, key: tuple, context: str, vector: np.ndarray) -> int:
+        row = len(self.keys)
+        if row == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[row] = vector
+        self.contexts.append(context)
+        self.keys.append(key)
+        return row
+
+    def remove(self, row: int) -> Optional[tuple]:
+        """Swap-remove a row; returns the key whose row moved into its place"""
+        last = len(self.keys) - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.contexts[row] = self.contexts[last]
+            self.keys[row] = self.keys[last]
+            moved = self.keys[row]
+        self.contexts.pop()
+        self.keys.pop()
+        return moved
+
+    def nearest(self, vector: np.ndarray, context: str):
+        """(key, similarity) of the most similar entry recorded under the same context"""
+        n = len(self.keys)
+        if not n:
+            return None, 0.0
+        scores = self.vectors[:n] @ vector
+        same_context = np.fromiter((c == context for c in self.contexts), dtype=bool, count=n)
+        scores = np.where(same_context, scores, -1.0)
+        best = int(np.argmax(scores))
+        return self.keys[best], float(scores[best])
+
+
+class ResponseCache:
+    """
+    Cache of assistant replies for repeated small talk.
+
+    Entries are keyed on (namespace, normalized user message, hash of the
+    user's previous few messages), so "Hey" opening a conversation and "Hey"
+    in the middle of one are different entries. A miss on the exact key falls
+    back to the most similar cached message with the same context, if its
+    cosine similarity clears similarity_threshold.
+
+    variety > 1 keeps collecting distinct replies for a key; the cache only
+    starts answering once it has that many and then picks one at random, so
+    "How are you?" doesn't get the identical answer every time.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 6 * 3600, similarity_threshold: float = 0.9,
+                 variety: int = 3, max_message_chars: int = 120, context_messages: int = 2, embedder=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.variety = max(1, variety)
+        self.max_message_chars = max_message_chars  # Long messages essentially never repeat
+        self.context_messages = context_messages
+        self.embedder = embedder or HashingEmbedder()
+
+        self.entries: "OrderedDict[tuple, CachedReply]" = OrderedDict()  # Least recently used first
+        self.indexes: Dict[str, _NamespaceIndex] = {}
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    @property
+    def hits(self) -> int:
+        return self.exact_hits + self.near_hits
+
+    def cacheable(self, message: str) -> bool:
+        return 0 < len(message) <= self.max_message_chars
+
+    def _context(self, recent: Sequence[str]) -> str:
+        return context_hash(recent[-self.context_messages:] if self.context_messages else [])
+
+    def lookup(self, namespace: str, message: str, recent: Sequence[str]) -> Optional[str]:
+        """A cached reply for message given the preceding messages, or None"""
+        normalized = normalize_message(message)
+        if not self.cacheable(normalized):
+            return None
+        context = self._context(recent)
+        key = (namespace, normalized, context)
+
+        with self._lock:
+            entry = self._live_entry(key)
+            near = False
+            if entry is None:
+                index = self.indexes.get(namespace)
+                if index is not None:
+                    nearest, similarity = index.nearest(self.embedder.embed(normalized), context)
+                    if nearest is not None and similarity >= self.similarity_threshold:
+                        entry = self._live_entry(nearest)
+                        near = entry is not None
+
+            if entry is None or len(entry.replies) < self.variety:
+                self.misses += 1
+                return None
+
+            if near:
+                self.near_hits += 1
+            else:
+                self.exact_hits += 1
+            return random.choice(entry.replies)
+
+    def store(self, namespace: str, message: str, recent: Sequence[str], reply: str):
+        normalized = normalize_message(message)
+        reply = reply.strip()
+        if not reply or not self.cacheable(normalized):
+            return
+        context = self._context(recent)
+        key = (namespace, normalized, context)
+
+        with self._lock:
+            entry = self._live_entry(key)
+            if entry is None:
+                entry = CachedReply(namespace=namespace, message=normalized, context=context)
+                index = self.indexes.setdefault(namespace, _NamespaceIndex(self.embedder.dim))
+                entry.row = index.add(key, context, self.embedder.embed(normalized))
+                self.entries[key] = entry
+                self._evict()
+            if reply not in entry.replies and len(entry.replies) < self.variety:
+                entry.replies.append(reply)
+
+    def _live_entry(self, key: tuple) -> Optional[CachedReply]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: tuple):
+        entry = self.entries.pop(key)
+        index = self.indexes[entry.namespace]
+        moved = index.remove(entry.row)
+        if moved is not None:
+            self.entries[moved].row = entry.row
+        if not index.keys:
+            del self.indexes[entry.namespace]
+
+    def _evict(self):
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            for key in [k for k, e in self.entries.items() if namespace is None or e.namespace == namespace]:
+                self._remove(key)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from ai_core.ai_brain import AIPersonality
+
+
+@dataclass
+class ConversationSession:
+    session_id: str
+    ai: AIPersonality
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.time)
+    connections: int = 0
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by this session's conversation history"""
+        return self.ai.memory_usage()
+
+
+class SessionManager:
+    """Keeps one AIPersonality per conversation session on top of a shared model"""
+
+    def __init__(self, model, tokenizer=None, personality_config=None, state_cache=None, scheduler=None,
+                 engine=None, model_manager=None, response_cache=None, long_term_memory=None,
+                 conversation_store=None, summarize=False, summary_model=None, lora_adapters=None,
+                 max_sessions=500, max_memory_bytes=64 * 1024 * 1024, idle_timeout=1800):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.personality_config = personality_config
+        self.state_cache = state_cache
+        self.scheduler = scheduler
+        self.engine = engine
+        self.model_manager = model_manager
+        self.response_cache = response_cache
+        self.long_term_memory = long_term_memory
+        self.conversation_store = conversation_store
+        self.summarize = summarize
+        self.summary_model = summary_model
+        self.lora_adapters = lora_adapters
+
+        self.max_sessions = max_sessions
+        self.max_memory_bytes = max_memory_bytes
+        self.idle_timeout = idle_timeout
+
+        # Least recently used session first
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}  # Stored sessions being read back, by id
+        self._eviction_task: Optional[asyncio.Task] = None
+
+    def create_personality(self, session_id: str) -> AIPersonality:
+        return AIPersonality(
+            self.model,
+            tokenizer=self.tokenizer,
+            personality_config=self.personality_config,
+            state_cache=self.state_cache,
+            session_id=session_id,
+            scheduler=self.scheduler,
+            engine=self.engine,
+            model_manager=self.model_manager,
+            response_cache=self.response_cache,
+            long_term_memory=self.long_term_memory,
+            conversation_store=self.conversation_store,
+            summarize=self.summarize,
+            summary_model=self.summary_model,
+            lora_adapters=self.lora_adapters
+        )
+
+    def attach_model(self, model, tokenizer=None, engine=None):
+        """Point every session (existing and future) at a model that finished loading"""
+        self.model = model
+        self.tokenizer = tokenizer
+        self.engine = engine
+        for session in self.sessions.values():
+            session.ai.model = model
+            session.ai.tokenizer = tokenizer
+            session.ai.engine = engine
+
+    async def get_or_create(self, session_id: Optional[str] = None) -> ConversationSession:
+        """Resume an existing session or start a new one with a server-issued id"""
+        session = self.sessions.get(session_id) if session_id else None
+
+        if session is None and session_id is None:
+            session_id = uuid.uuid4().hex
+            session = self.sessions[session_id] = ConversationSession(
+                session_id=session_id,
+                ai=self.create_personality(session_id)
+            )
+        elif session is None:
+            # Concurrent attaches to the same id share one read of the store
+            loading = self._loading.get(session_id)
+            if loading is None:
+                loading = self._loading[session_id] = asyncio.ensure_future(self._restore(session_id))
+                loading.add_done_callback(lambda _: self._loading.pop(session_id, None))
+            session = await asyncio.shield(loading)
+
+        self.sessions.move_to_end(session.session_id)
+        session.touch()
+        self.enforce_limits()
+        return session
+
+    async def _restore(self, session_id: str) -> ConversationSession:
+        session = ConversationSession(
+            session_id=session_id,
+            ai=self.create_personality(session_id)
+        )
+        await self.load_stored(session)
+        return self.sessions.setdefault(session_id, session)
+
+    async def load_stored(self, session: ConversationSession):
+        """Bring back a session evicted from memory or from before a restart"""
+        if self.conversation_store is None:
+            return
+        # SQLite reads (and waiting for this session's queued writes) stay off the event loop
+        stored, messages = await asyncio.get_event_loop().run_in_executor(
+            None, self.conversation_store.load_session, session.session_id, session.ai.max_history_length
+        )
+        if stored is not None:
+            session.ai.load_history(stored, messages)
+            session.created_at = stored.conversation_start or session.created_at
+
+    async def attach(self, session_id: Optional[str] = None) -> ConversationSession:
+        """Bind a client connection to a session"""
+        session = await self.get_or_create(session_id)
+        session.connections += 1
+        return session
+
+    def detach(self, session: ConversationSession):
+        """Release a client connection; the session stays resumable until evicted"""
+        session.connections = max(0, session.connections - 1)
+        session.touch()
+
+    def touch(self, session: ConversationSession):
+        session.touch()
+        if session.session_id in self.sessions:
+            self.sessions.move_to_end(session.session_id)
+
+    def remove(self, session_id: str):
+        self.sessions.pop(session_id, None)
+        if self.state_cache is not None:
+            self.state_cache.discard(session_id)
+
+    def total_memory(self) -> int:
+        return sum(session.memory_usage() for session in self.sessions.values())
+
+    def enforce_limits(self):
+        """Evict idle sessions (least recently used first) until under the count and memory caps"""
+        total_memory = self.total_memory()
+
+        for session_id in list(self.sessions):
+            if len(self.sessions) <= self.max_sessions and total_memory <= self.max_memory_bytes:
+                break
+            session = self.sessions[session_id]
+            if session.connections > 0:
+                continue
+            total_memory -= session.memory_usage()
+            self.remove(session_id)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop detached sessions that have been idle longer than idle_timeout"""
+        now = now or time.time()
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session.connections == 0 and now - session.last_active > self.idle_timeout
+        ]
+        for session_id in expired:
+            self.remove(session_id)
+        return len(expired)
+
+    async def _eviction_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.evict_idle()
+            self.enforce_limits()
+
+    def start_eviction(self, interval: float = 60):
+        if self._eviction_task is None or self._eviction_task.done():
+            self._eviction_task = asyncio.create_task(self._eviction_loop(interval))
+
+    def stop_eviction(self):
+        if self._eviction_task:
+            self._eviction_task.cancel()
+            self._eviction_task = None
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self.sessions),
+            "connected_sessions": sum(1 for s in self.sessions.values() if s.connections > 0),
+            "memory_bytes": self.total_memory(),
+            "max_memory_bytes": self.max_memory_bytes
+        }
@@ -0,0 +1,221 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DRAFT_PROMPT_LOOKUP = "prompt_lookup"
+DRAFT_MODEL = "model"
+
+
+class PromptLookupDraft:
+    """
+    Proposes the tokens that followed the last n-gram the previous time it
+    appeared in the context. Free to run, and good at echoing names, phrases
+    the user just typed and the personality's stock expressions.
+    """
+
+    def __init__(self, num_pred_tokens: int = 10, max_ngram_size: int = 2):
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        self.num_pred_tokens = num_pred_tokens
+        self._lookup = LlamaPromptLookupDecoding(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens)
+
+    def prepare(self, model) -> bool:
+        return True
+
+    def __call__(self, input_ids: np.ndarray) -> np.ndarray:
+        return self._lookup(input_ids)
+
+
+class ModelDraft:
+    """
+    Greedy proposals from a small GGUF sharing the main model's vocabulary
+    (e.g. Qwen2.5-0.5B-Instruct in front of Qwen2.5-14B-Instruct).
+
+    The draft model is a ModelManager registry entry, so it counts against the
+    RAM budget and is reloaded on demand if it gets evicted. Its own context
+    keeps the conversation, so llama.cpp prefix matching only evaluates the
+    tokens accepted since the previous proposal.
+    """
+
+    def __init__(self, model: str, num_pred_tokens: int = 4, model_manager=None):
+        self.model = model  # Registry name or path to a GGUF file
+        self.num_pred_tokens = num_pred_tokens
+        self.model_manager = model_manager
+        self.llm = None
+
+    def prepare(self, model) -> bool:
+        """Load (or re-fetch) the draft model for a turn on `model`; False when it can't be used"""
+        if self.model_manager is None:
+            from model.model_manager import ModelManager
+            self.model_manager = ModelManager()
+
+        if self.model not in self.model_manager.registry:
+            if not os.path.exists(self.model):
+                logger.error(f"Draft model '{self.model}' is neither a registered model nor a file")
+                return False
+            n_ctx = model.n_ctx() if hasattr(model, "n_ctx") else None
+            self.model_manager.register_model(self.model, self.model, **({"n_ctx": n_ctx} if n_ctx else {}))
+
+        self.llm = self.model_manager.get_model(self.model)
+        if self.llm is model:
+            return False
+        if self.llm.n_vocab() != model.n_vocab():
+            logger.error(f"Draft model '{self.model}' has a different vocabulary than the main model")
+            return False
+        return True
+
+    def __call__(self, input_ids: np.ndarray) -> np.ndarray:
+        llm = self.llm
+        if llm is None or len(input_ids) + self.num_pred_tokens > llm.n_ctx():
+            return np.array([], dtype=np.intc)
+
+        draft: List[int] = []
+        eos = llm.token_eos()
+        from model.model_manager import model_lock
+        # Sessions may also chat with the draft model directly; its context serves one caller at a time
+        with model_lock(llm):
+            for token in llm.generate(input_ids.tolist(), temp=0.0, top_k=1, repeat_penalty=1.0, reset=True):
+                if token == eos:
+                    break
+                draft.append(token)
+                if len(draft) >= self.num_pred_tokens:
+                    break
+        return np.array(draft, dtype=np.intc)
+
+
+class _SpeculativeTurn:
+    """
+    Attaches a draft to a model for one generation and counts what it proposed.
+
+    Llama.generate verifies drafts by sampling every drafted position with the
+    main model's own sampler and keeps tokens up to the first mismatch, so the
+    output distribution is unchanged; only the number of forward passes drops.
+    Enter it while holding the model's model_lock: draft_model is per model.
+    """
+
+    __slots__ = ("speculation", "model", "previous", "calls", "proposed")
+
+    def __init__(self, speculation: "SpeculativeDecoding", model):
+        self.speculation = speculation
+        self.model = model
+        self.previous = None
+        self.calls = 0
+        self.proposed = 0
+
+    def __call__(self, input_ids: np.ndarray) -> np.ndarray:
+        tokens = self.speculation.draft(input_ids)
+        self.calls += 1
+        self.proposed += len(tokens)
+        return tokens
+
+    def __enter__(self):
+        self.previous = self.model.draft_model
+        self.model.draft_model = self
+        return self
+
+    def __exit__(self, *exc):
+        self.model.draft_model = self.previous
+        return False
+
+    def finish(self, generated_tokens: int):
+        self.speculation.record(self.calls, self.proposed, generated_tokens)
+
+
+class SpeculativeDecoding:
+    """A draft source shared by every personality configured with it, plus its acceptance stats"""
+
+    def __init__(self, label: str, draft):
+        self.label = label
+        self.draft = draft
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.draft_calls = 0
+        self.proposed_tokens = 0
+        self.accepted_tokens = 0
+        self.generated_tokens = 0
+        self._warned = False
+
+    def attach(self, model) -> Optional[_SpeculativeTurn]:
+        """A context manager that drafts for model during one generation, or None if it can't"""
+        if not hasattr(model, "draft_model"):
+            return None
+        if not getattr(getattr(model, "context_params", None), "logits_all", False):
+            # Verifying a draft needs logits for every position; see ModelManager.load_model(speculative=True)
+            if not self._warned:
+                logger.warning("Speculative decoding needs a model loaded with speculative=True; decoding normally")
+                self._warned = True
+            return None
+        if not self.draft.prepare(model):
+            return None
+        return _SpeculativeTurn(self, model)
+
+    def record(self, calls: int, proposed: int, generated: int):
+        """
+        The prompt pass yields one token and each verify pass yields one
+        sampled token plus the accepted drafts, so accepted ~ generated - 1 - calls.
+        Approximate: counts streamed chunks, and the last pass may stop early.
+        """
+        accepted = min(max(generated - 1 - calls, 0), proposed)
+        with self._lock:
+            self.turns += 1
+            self.draft_calls += calls
+            self.proposed_tokens += proposed
+            self.accepted_tokens += accepted
+            self.generated_tokens += generated
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.accepted_tokens / self.proposed_tokens if self.proposed_tokens else 0.0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            passes = self.draft_calls + self.turns
+            return {
+                "draft": self.label,
+                "turns": self.turns,
+                "proposed_tokens": self.proposed_tokens,
+                "accepted_tokens": self.accepted_tokens,
+                "acceptance_rate": self.acceptance_rate,
+                # Plain decoding is 1.0; the speedup on decode is roughly this ratio
+                "tokens_per_pass": self.generated_tokens / passes if passes else 0.0
+            }
+
+
+_decoders: Dict[tuple, SpeculativeDecoding] = {}
+_decoders_lock = threading.Lock()
+
+
+def get_speculative_decoding(config: Dict, model_manager=None) -> SpeculativeDecoding:
+    """
+    Shared SpeculativeDecoding for a personality's "speculative" config, e.g.
+    {"draft": "prompt_lookup", "num_pred_tokens": 10} or
+    {"draft": "model", "model": "small", "num_pred_tokens": 4}
+    """
+    kind = config.get("draft", DRAFT_PROMPT_LOOKUP)
+    num_pred_tokens = config.get("num_pred_tokens", 10 if kind == DRAFT_PROMPT_LOOKUP else 4)
+    key = (kind, config.get("model"), num_pred_tokens)
+
+    with _decoders_lock:
+        decoding = _decoders.get(key)
+        if decoding is None:
+            if kind == DRAFT_PROMPT_LOOKUP:
+                draft = PromptLookupDraft(num_pred_tokens=num_pred_tokens,
+                                          max_ngram_size=config.get("max_ngram_size", 2))
+                label = kind
+            elif kind == DRAFT_MODEL and config.get("model"):
+                draft = ModelDraft(config["model"], num_pred_tokens=num_pred_tokens, model_manager=model_manager)
+                label = f"{kind}:{config['model']}"
+            else:
+                raise ValueError(f"Unknown speculative decoding config: {config}")
+            decoding = _decoders[key] = SpeculativeDecoding(label, draft)
+        return decoding
+
+
+def speculative_stats() -> List[Dict]:
+    with _decoders_lock:
+        decoders = list(_decoders.values())
+    return [decoding.stats() for decoding in decoders]
@@ -1,8 +1,31 @@
-import whisper
+import threading
 #6197
 
-model = whisper.load_model("base")
+MODEL_NAME = "base"
+
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Load Whisper on first use instead of at import time"""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                import whisper
+                model = whisper.load_model(MODEL_NAME)
+    return model
+
+def warmup():
+    """Load the weights and run one tiny decode so the first real request is fast"""
+    import numpy as np
+    get_model().transcribe(np.zeros(16000, dtype=np.float32))
 
 def transcribe_audio(audio_path:str)-> str:
-    result = model.transcribe(audio_path)
+    result = get_model().transcribe(audio_path)
+    return result['text']
+
+def transcribe_samples(samples)-> str:
+    """Transcribe 16 kHz mono float32 audio already in memory"""
+    result = get_model().transcribe(samples)
     return result['text']
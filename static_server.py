@@ -0,0 +1,158 @@
+import hashlib
+import mimetypes
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from ai_core.text_to_speech import TTSCache
+from server.metrics import registry as metrics
+from server.readiness import readiness
+
+PUBLIC_DIR = "public"
+AUDIO_FOLDER = "audio_responses"
+
+# Assets up to this size are kept in memory; larger files always go through sendfile
+MEMORY_CACHE_MAX_FILE = 256 * 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+@dataclass
+class CachedAsset:
+    mtime_ns: int
+    size: int
+    body: bytes
+    etag: str
+    content_type: str
+
+
+class StaticFiles:
+    """
+    Small files from one directory held in memory.
+
+    Each request still stats the file, so edits to index.html show up on the
+    next load, but the bytes and their ETag are only recomputed when the
+    mtime or size changes.
+    """
+
+    def __init__(self, root: str, max_file_size: int = MEMORY_CACHE_MAX_FILE):
+        self.root = os.path.abspath(root)
+        self.max_file_size = max_file_size
+        self.assets: Dict[str, CachedAsset] = {}
+
+    def resolve(self, filename: str) -> Optional[str]:
+        """Absolute path inside root, or None for missing files and traversal attempts"""
+        path = os.path.abspath(os.path.join(self.root, filename))
+        if os.path.commonpath([path, self.root]) != self.root or not os.path.isfile(path):
+            return None
+        return path
+
+    def get(self, path: str) -> Optional[CachedAsset]:
+        stat = os.stat(path)
+        if stat.st_size > self.max_file_size:
+            return None
+
+        asset = self.assets.get(path)
+        if asset is None or asset.mtime_ns != stat.st_mtime_ns or asset.size != stat.st_size:
+            with open(path, "rb") as f:
+                body = f.read()
+            asset = CachedAsset(
+                mtime_ns=stat.st_mtime_ns,
+                size=stat.st_size,
+                body=body,
+                etag=hashlib.sha1(body).hexdigest(),
+                content_type=mimetypes.guess_type(path)[0] or "application/octet-stream"
+            )
+            self.assets[path] = asset
+        return asset
+
+
+def _asset_response(request: web.Request, asset: CachedAsset) -> web.Response:
+    headers = {"ETag": f'"{asset.etag}"', "Cache-Control": REVALIDATE}
+    if request.headers.get("If-None-Match") == f'"{asset.etag}"':
+        return web.Response(status=304, headers=headers)
+    return web.Response(body=asset.body, content_type=asset.content_type, headers=headers)
+
+
+def create_static_app(public_dir: str = PUBLIC_DIR, audio_folder: str = AUDIO_FOLDER) -> web.Application:
+    """
+    asyncio replacement for create_upload_app, for running inside the server's event loop.
+
+    Files go out through aiohttp's FileResponse, which uses sendfile() (zero
+    copy) and handles Range, If-None-Match and If-Modified-Since. Cached TTS
+    files are named after a hash of their content, so they are served as
+    immutable.
+    """
+    os.makedirs(audio_folder, exist_ok=True)
+    public = StaticFiles(public_dir)
+    audio_root = os.path.abspath(audio_folder)
+
+    async def health(request):
+        return web.json_response({"status": "ok"})
+
+    async def ready(request):
+        status = readiness.to_dict()
+        return web.json_response(status, status=200 if status["ready"] else 503)
+
+    async def prometheus_metrics(request):
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def serve_public(request):
+        path = public.resolve(request.match_info.get("filename") or "index.html")
+        if path is None:
+            return web.Response(status=404, text="File Not Found")
+
+        asset = public.get(path)
+        if asset is not None:
+            return _asset_response(request, asset)
+        return web.FileResponse(path, headers={"Cache-Control": REVALIDATE})
+
+    async def serve_audio(request):
+        filename = request.match_info["filename"]
+        path = os.path.abspath(os.path.join(audio_root, filename))
+        if os.path.dirname(path) != audio_root or not os.path.isfile(path):
+            return web.Response(status=404, text=f"File not found: {filename}")
+
+        cache_control = IMMUTABLE if TTSCache._is_cache_file(filename) else REVALIDATE
+        return web.FileResponse(path, headers={"Cache-Control": cache_control})
+
+    async def upload_audio(request):
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name != "audio":
+                continue
+            filename = f"{uuid.uuid4()}.mp3"
+            filepath = os.path.join(audio_folder, filename)
+            with open(filepath, "wb") as f:
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            return web.json_response({"filepath": f"{audio_folder}/{filename}"})
+        return web.json_response({"error": "No audio file provided"}, status=400)
+
+    app = web.Application()
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/ready", ready),
+        web.get("/metrics", prometheus_metrics),
+        web.post("/upload_audio", upload_audio),
+        web.get(f"/{audio_folder}/{{filename}}", serve_audio),
+        web.get("/", serve_public),
+        web.get("/{filename:.+}", serve_public),
+    ])
+    return app
+
+
+async def start_static_server(host="0.0.0.0", port=5000) -> web.AppRunner:
+    runner = web.AppRunner(create_static_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Static file server running on http://{host}:{port}")
+    return runner
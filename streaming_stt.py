@@ -0,0 +1,211 @@
+import math
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+WHISPER_SAMPLE_RATE = 16000
+
+
+def decode_pcm(data: bytes, encoding: str = "pcm_s16le") -> np.ndarray:
+    """Raw little-endian PCM bytes to mono float32 in [-1, 1]"""
+    if encoding == "float32":
+        return np.frombuffer(data, dtype="<f4").astype(np.float32, copy=False)
+    if encoding == "pcm_s16le":
+        return np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    raise ValueError(f"Unsupported audio encoding: {encoding}")
+
+
+class Resampler:
+    """
+    Streaming band-limited resampler (Kaiser-windowed sinc, polyphase).
+
+    Output sample n sits exactly at input time n * source_rate / target_rate,
+    kept as integers so long streams don't drift, and the filter's last input
+    samples carry over between calls so chunk boundaries don't click. When
+    downsampling, the kernel cuts off below the target Nyquist rate so speech
+    above it doesn't alias into the band Whisper hears.
+    """
+
+    def __init__(self, source_rate: int, target_rate: int = WHISPER_SAMPLE_RATE,
+                 zero_crossings: int = 16, beta: float = 8.0):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        divisor = math.gcd(source_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = source_rate // divisor
+        # Relative to the source Nyquist rate, leaving room for the transition band
+        self.cutoff = 0.95 * min(1.0, target_rate / source_rate)
+        self.half_width = int(np.ceil(zero_crossings / self.cutoff))
+        self.beta = beta
+        self._offsets = np.arange(1 - self.half_width, self.half_width + 1)
+        self._reset()
+
+    def _reset(self):
+        # Zeros before the first sample, so output starts at input time 0
+        self._buffer = np.zeros(self.half_width, dtype=np.float32)
+        self._buffer_start = -self.half_width
+        self._next_output = 0
+
+    def _kernel(self, distance: np.ndarray) -> np.ndarray:
+        x = distance / self.half_width
+        window = np.i0(self.beta * np.sqrt(np.clip(1.0 - x * x, 0.0, None))) / np.i0(self.beta)
+        return (self.cutoff * np.sinc(self.cutoff * distance) * window).astype(np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        if self.source_rate == self.target_rate:
+            return samples
+        buffer = np.concatenate([self._buffer, samples.astype(np.float32, copy=False)])
+
+        # Outputs need half_width samples of look-ahead; later ones wait for the next chunk
+        last = self._buffer_start + buffer.size - 1 - self.half_width
+        end = (last * self.up) // self.down + 1
+        outputs = np.arange(self._next_output, max(end, self._next_output), dtype=np.int64) * self.down
+        bases, phases = np.divmod(outputs, self.up)
+
+        # Each phase's taps are shared by every output landing on it
+        unique, inverse = np.unique(phases, return_inverse=True)
+        taps = self._kernel(unique[:, None] / self.up - self._offsets)[inverse]
+        indices = (bases - self._buffer_start)[:, None] + self._offsets
+        output = (buffer[indices] * taps).sum(axis=1)
+
+        self._next_output += outputs.size
+        drop = (self._next_output * self.down) // self.up - self.half_width + 1 - self._buffer_start
+        self._buffer = buffer[drop:].copy()
+        self._buffer_start += drop
+        return output
+
+    def flush(self) -> np.ndarray:
+        """End of stream: the output still waiting on look-ahead"""
+        if self.source_rate == self.target_rate:
+            return np.zeros(0, dtype=np.float32)
+        tail = self.process(np.zeros(self.half_width, dtype=np.float32))
+        self._reset()
+        return tail
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """Resample a whole clip"""
+    if source_rate == target_rate or samples.size == 0:
+        return samples
+    resampler = Resampler(source_rate, target_rate)
+    return np.concatenate([resampler.process(samples), resampler.flush()])
+
+
+class VoiceActivitySegmenter:
+    """
+    Energy-based voice activity detection over 16 kHz float32 audio.
+
+    Audio is cut into fixed frames; a frame counts as speech when its RMS
+    clears an adaptive noise floor. An utterance starts after min_speech_ms
+    of speech (with pre_roll_ms of lead-in kept) and ends after max_silence_ms
+    of silence, or when it reaches max_utterance_s.
+    """
+
+    def __init__(self, sample_rate: int = WHISPER_SAMPLE_RATE, frame_ms: int = 30,
+                 min_speech_ms: int = 240, max_silence_ms: int = 600, pre_roll_ms: int = 300,
+                 max_utterance_s: float = 30, energy_ratio: float = 3.0, min_energy: float = 0.005):
+        self.sample_rate = sample_rate
+        self.frame_size = sample_rate * frame_ms // 1000
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.max_silence_frames = max(1, max_silence_ms // frame_ms)
+        self.max_utterance_frames = int(max_utterance_s * 1000 // frame_ms)
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+
+        self.noise_floor = min_energy
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._pre_roll: deque = deque(maxlen=max(1, pre_roll_ms // frame_ms))
+        self._utterance: List[np.ndarray] = []
+        self._speech_run = 0
+        self._silence_run = 0
+        self._trailing_silence = 0
+        self._in_speech = False
+
+    def _is_speech(self, frame: np.ndarray) -> bool:
+        energy = float(np.sqrt(np.mean(frame * frame)))
+        threshold = max(self.min_energy, self.noise_floor * self.energy_ratio)
+        speech = energy > threshold
+        if not speech:
+            # Track background noise slowly so a loud room doesn't read as constant speech
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * max(energy, 1e-4)
+        return speech
+
+    def _finish(self) -> Optional[np.ndarray]:
+        frames = self._utterance
+        self._utterance = []
+        self._in_speech = False
+        self._speech_run = self._silence_run = 0
+        if not frames:
+            return None
+        # Drop the trailing silence that ended the utterance
+        keep = len(frames) - min(self._trailing_silence, len(frames) - 1)
+        return np.concatenate(frames[:keep])
+
+    def feed(self, samples: np.ndarray) -> List[np.ndarray]:
+        """Add audio; returns any utterances completed by it"""
+        audio = np.concatenate([self._remainder, samples]) if self._remainder.size else samples
+        n_frames = audio.size // self.frame_size
+        self._remainder = audio[n_frames * self.frame_size:].copy()
+
+        utterances = []
+        frames = audio[:n_frames * self.frame_size].reshape(n_frames, self.frame_size) if n_frames else ()
+
+        for frame in frames:
+            speech = self._is_speech(frame)
+
+            if not self._in_speech:
+                self._pre_roll.append(frame)
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.min_speech_frames:
+                    self._in_speech = True
+                    self._utterance = list(self._pre_roll)
+                    self._pre_roll.clear()
+                    self._silence_run = 0
+                continue
+
+            self._utterance.append(frame)
+            self._silence_run = 0 if speech else self._silence_run + 1
+
+            if self._silence_run >= self.max_silence_frames or len(self._utterance) >= self.max_utterance_frames:
+                self._trailing_silence = self._silence_run
+                utterances.append(self._finish())
+
+        return [u for u in utterances if u is not None]
+
+    def flush(self) -> Optional[np.ndarray]:
+        """End of stream: return the utterance in progress, if any"""
+        if not self._in_speech:
+            self._pre_roll.clear()
+            return None
+        if self._remainder.size:
+            self._utterance.append(self._remainder)
+            self._remainder = np.zeros(0, dtype=np.float32)
+        self._trailing_silence = self._silence_run
+        return self._finish()
+
+
+class StreamingTranscriptionInput:
+    """Per-connection state for an audio stream: decoding, resampling and segmentation"""
+
+    def __init__(self, sample_rate: int = WHISPER_SAMPLE_RATE, encoding: str = "pcm_s16le"):
+        self.sample_rate = sample_rate
+        self.encoding = encoding
+        self.sample_width = 4 if encoding == "float32" else 2
+        self.resampler = Resampler(sample_rate)
+        self.segmenter = VoiceActivitySegmenter()
+        # Bytes of a sample split across chunks
+        self._partial = b""
+
+    def feed(self, data: bytes) -> List[np.ndarray]:
+        data = self._partial + data
+        whole = len(data) - len(data) % self.sample_width
+        self._partial = data[whole:]
+        samples = self.resampler.process(decode_pcm(data[:whole], self.encoding))
+        return self.segmenter.feed(samples)
+
+    def finish(self) -> List[np.ndarray]:
+        """End of stream: utterances completed by the remaining audio, then the one in progress"""
+        utterances = self.segmenter.feed(self.resampler.flush())
+        last = self.segmenter.flush()
+        return utterances + [last] if last is not None else utterances
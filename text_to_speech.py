@@ -1,25 +1,211 @@
-from elevenlabs.client import ElevenLabs
+from collections import OrderedDict
+from typing import Iterable, Optional
+import hashlib
+import logging
+import threading
+import time
 import uuid
 import os
+from server.metrics import stage_seconds
 #1044
-client = ElevenLabs(
-    api_key="Add Yours here "
-)
-
-def text_to_speech(text: str, output_dir="audio_responses") -> str:
-    os.makedirs(output_dir, exist_ok=True)
-    # Get the audio generator
-    audio_generator = client.text_to_speech.stream(
-        voice_id="ZF6FPAbjXT4488VcRRnw",
+logger = logging.getLogger(__name__)
+
+client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Build the ElevenLabs client on first use instead of at import time"""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from elevenlabs.client import ElevenLabs
+                client = ElevenLabs(
+                    api_key="Add Yours here "
+                )
+    return client
+
+DEFAULT_VOICE_ID = "ZF6FPAbjXT4488VcRRnw"
+
+
+class TTSCache:
+    """
+    Content-addressed store for synthesized speech.
+
+    Files are named after a hash of (voice id, text), so identical lines are
+    synthesized once and then served from disk. The in-memory index keeps LRU
+    order and total size; the oldest entries are deleted once max_bytes is
+    exceeded. Anything else in the directory (temp files, legacy uuid files,
+    uploads) is an orphan and is removed by the janitor once it is older than
+    orphan_age seconds.
+    """
+
+    def __init__(self, cache_dir="audio_responses", max_bytes=512 * 1024 * 1024, orphan_age=3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.orphan_age = orphan_age
+
+        self.index: "OrderedDict[str, int]" = OrderedDict()  # file name -> size, oldest first
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> Event, so concurrent misses synthesize once
+        self._janitor = None
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key(text: str, voice_id: str) -> str:
+        return hashlib.sha256(f"{voice_id}\0{text}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _is_cache_file(name: str) -> bool:
+        stem, ext = os.path.splitext(name)
+        return ext == ".mp3" and len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and self._is_cache_file(entry.name):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(entries):
+            self.index[name] = size
+            self.size_bytes += size
+
+    def path_for(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def lookup(self, text: str, voice_id: str = DEFAULT_VOICE_ID) -> Optional[str]:
+        """Path of the cached audio for text, or None without synthesizing"""
+        name = f"{self.key(text, voice_id)}.mp3"
+        with self._lock:
+            if name not in self.index:
+                return None
+            self.index.move_to_end(name)
+        return self.path_for(name)
+
+    def get_or_synthesize(self, text: str, voice_id: str, synthesize) -> str:
+        key = self.key(text, voice_id)
+        name = f"{key}.mp3"
+
+        while True:
+            with self._lock:
+                if name in self.index:
+                    self.index.move_to_end(name)
+                    self.hits += 1
+                    return self.path_for(name)
+                waiting = self._inflight.get(key)
+                if waiting is None:
+                    self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            waiting.wait()
+
+        try:
+            # Write to a temp name and rename, so readers never see a partial file
+            temp_path = self.path_for(f"{name}.{uuid.uuid4().hex}.tmp")
+            with stage_seconds.time(stage="tts_synthesize"), open(temp_path, "wb") as f:
+                for chunk in synthesize(text, voice_id):
+                    f.write(chunk)
+            os.replace(temp_path, self.path_for(name))
+
+            with self._lock:
+                size = os.path.getsize(self.path_for(name))
+                self.index[name] = size
+                self.size_bytes += size
+                self._evict()
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+        return self.path_for(name)
+
+    def _evict(self):
+        while self.size_bytes > self.max_bytes and len(self.index) > 1:
+            name, size = self.index.popitem(last=False)
+            self.size_bytes -= size
+            try:
+                os.remove(self.path_for(name))
+            except OSError as e:
+                logger.warning(f"Failed to evict cached audio {name}: {e}")
+
+    def sweep(self) -> int:
+        """Remove orphaned files and re-apply the quota; returns the number of files deleted"""
+        removed = 0
+        cutoff = time.time() - self.orphan_age
+
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            with self._lock:
+                indexed = entry.name in self.index
+            if indexed:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except OSError:
+                pass
+
+        with self._lock:
+            for name in [n for n in self.index if not os.path.exists(self.path_for(n))]:
+                self.size_bytes -= self.index.pop(name)
+            self._evict()
+        return removed
+
+    def start_janitor(self, interval=600):
+        def _run():
+            while True:
+                time.sleep(interval)
+                try:
+                    removed = self.sweep()
+                    if removed:
+                        logger.info(f"TTS cache janitor removed {removed} orphaned files")
+                except Exception as e:
+                    logger.error(f"TTS cache janitor failed: {e}")
+
+        if self._janitor is None:
+            self._janitor = threading.Thread(target=_run, name="tts-cache-janitor", daemon=True)
+            self._janitor.start()
+
+    def prewarm(self, lines: Iterable[str], voice_id: str = DEFAULT_VOICE_ID):
+        """Synthesize common lines ahead of time so their first use is a cache hit"""
+        for line in lines:
+            try:
+                text_to_speech(line, output_dir=self.cache_dir, voice_id=voice_id)
+            except Exception as e:
+                logger.warning(f"Failed to prewarm TTS line {line!r}: {e}")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(output_dir="audio_responses") -> TTSCache:
+    with _caches_lock:
+        if output_dir not in _caches:
+            _caches[output_dir] = TTSCache(
+                output_dir,
+                max_bytes=int(os.environ.get("ANYA_TTS_CACHE_BYTES", 512 * 1024 * 1024))
+            )
+        return _caches[output_dir]
+
+
+def _synthesize(text: str, voice_id: str):
+    return get_client().text_to_speech.stream(
+        voice_id=voice_id,
         text=text
     )
-    file_name = f"{uuid.uuid4()}.mp3"
-    path = os.path.join(output_dir, file_name)
-    with open(path, "wb") as f:
-        for chunk in audio_generator:
-            f.write(chunk)
-    return path
-    print(f"[TTS] Saving AI audio to: {audio_path}")
+
+
+def text_to_speech(text: str, output_dir="audio_responses", voice_id=DEFAULT_VOICE_ID) -> str:
+    return get_cache(output_dir).get_or_synthesize(text, voice_id, _synthesize)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# End of sentence: terminal punctuation (plus closing quotes/brackets) followed by whitespace, or a line break
+SENTENCE_BOUNDARY = re.compile(r'[.!?…]+["\'”’)\]]*\s+|\n+')
+
+
+class SentenceSplitter:
+    """Cuts a streamed reply into sentences as soon as each one is complete"""
+
+    def __init__(self, min_chars: int = 20):
+        # Very short fragments ("Hey.", "Oh!") are merged with what follows so
+        # the TTS backend isn't called for a single word
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, delta: str) -> List[str]:
+        self.buffer += delta
+        sentences = []
+        start = 0
+
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = match.end()
+
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return rest or None
+
+
+class SpeechPipeline:
+    """
+    Synthesizes a reply sentence by sentence while it is still being generated.
+
+    Sentences are synthesized in the background and each audio segment is
+    handed to on_segment in reply order, so the client can start playback
+    after the first sentence instead of after the whole reply.
+    """
+
+    def __init__(self, synthesize: Callable[[str], Awaitable[str]],
+                 on_segment: Callable[[int, str, str], Awaitable], min_chars: int = 20):
+        self.synthesize = synthesize
+        self.on_segment = on_segment
+        self.splitter = SentenceSplitter(min_chars=min_chars)
+
+        self.audio_paths: List[str] = []
+        self._sentences: asyncio.Queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def feed(self, delta: str):
+        for sentence in self.splitter.feed(delta):
+            self._sentences.put_nowait(sentence)
+
+    async def finish(self) -> List[str]:
+        """Flush the trailing sentence and wait until every segment has been delivered"""
+        rest = self.splitter.flush()
+        if rest:
+            self._sentences.put_nowait(rest)
+        self._sentences.put_nowait(None)
+        await self._worker
+        return self.audio_paths
+
+    def cancel(self):
+        self._worker.cancel()
+
+    async def _run(self):
+        index = 0
+        while True:
+            sentence = await self._sentences.get()
+            if sentence is None:
+                return
+            try:
+                audio_path = await self.synthesize(sentence)
+            except Exception as e:
+                # One failed sentence shouldn't silence the rest of the reply
+                logger.error(f"TTS failed for segment {index}: {e}")
+                continue
+            self.audio_paths.append(audio_path)
+            await self.on_segment(index, sentence, audio_path)
+            index += 1
@@ -1,6 +1,8 @@
-from flask import Flask, send_from_directory, request, jsonify, send_file
+from flask import Flask, Response, send_from_directory, request, jsonify, send_file
 import os
 import uuid
+from server.readiness import readiness
+from server.metrics import registry as metrics
 #jlr
 def create_upload_app():
     app = Flask(__name__)
@@ -8,6 +10,20 @@ def create_upload_app():
 
     os.makedirs(AUDIO_FOLDER, exist_ok=True)
     
+    @app.route("/health")
+    def health():
+        return jsonify({"status": "ok"})
+
+    @app.route("/ready")
+    def ready():
+        # 503 until the models are loaded and warm, so load balancers hold traffic back
+        status = readiness.to_dict()
+        return jsonify(status), 200 if status["ready"] else 503
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
     @app.route("/")
     def index():
         print("=== ROOT ROUTE ACCESSED ===")
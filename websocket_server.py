@@ -1,37 +1,152 @@
 import asyncio 
+import base64
 import websockets
 import json
 import logging
 import traceback
-from typing import Set
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Optional, Set
+from urllib.parse import parse_qs, urlparse
 import time
 import os
 #92
 
 from ai_core.ai_brain import AIPersonality
-from model.model_manager import ModelManager
-from ai_core.speech_to_text import transcribe_audio
-from ai_core.text_to_speech import text_to_speech
+from ai_core.session_manager import ConversationSession, SessionManager
+from model.model_manager import DEFAULT_MODEL_PATH, ModelManager
+from model.kv_cache import SessionStateCache
+from model.inference_scheduler import GenerationCancelled, InferenceScheduler, SchedulerBusy
+from ai_core.audio_workers import AudioWorkers
+from ai_core.streaming_stt import StreamingTranscriptionInput
+from server import binary_protocol
+from server.readiness import FAILED, LOADING_MODEL, READY, WARMING_UP, readiness
+from server.metrics import registry as metrics, stage_seconds
+from ai_core.text_to_speech import get_cache
+from ai_core.tts_pipeline import SpeechPipeline
+from ai_core.response_cache import ResponseCache
+from ai_core.long_term_memory import LongTermMemory
+from ai_core.conversation_store import ConversationStore
+from model.speculative import DRAFT_MODEL, DRAFT_PROMPT_LOOKUP, speculative_stats
+from model.lora_adapters import LoRAAdapterManager
 
 # Setup detailed logging for debugging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+@dataclass
+class AudioStream:
+    input: StreamingTranscriptionInput
+    utterances: asyncio.Queue
+    worker: asyncio.Task
+
+
 class WebSocketServer:
-    def __init__(self, ai_personality: AIPersonality, host="localhost", port=8765):
-        self.ai = ai_personality
+    # Messages that need the language model (or Whisper) to be loaded
+    MODEL_MESSAGE_TYPES = {"user_message", "audio_input", "audio_stream_start", "audio_chunk"}
+
+    def __init__(self, session_manager: SessionManager, scheduler: Optional[InferenceScheduler] = None,
+                 audio_workers: Optional[AudioWorkers] = None, host="localhost", port=8765):
+        self.sessions = session_manager
+        self.scheduler = scheduler
+        self.audio = audio_workers or AudioWorkers()
         self.host = host
         self.port = port
         self.connected_clients: Set[websockets.WebSocketServerProtocol] = set()
+        self.client_sessions: Dict[websockets.WebSocketServerProtocol, ConversationSession] = {}
+        self.audio_streams: Dict[websockets.WebSocketServerProtocol, AudioStream] = {}
+        self.binary_clients: Set[websockets.WebSocketServerProtocol] = set()
 
-    async def register_client(self, websocket):
+    async def register_client(self, websocket, session_id: Optional[str] = None):
         self.connected_clients.add(websocket)
+        self.client_sessions[websocket] = await self.sessions.attach(session_id)
         logger.info(f"Client connected: {websocket.remote_address}")
 
     async def unregister_client(self, websocket):
         self.connected_clients.discard(websocket)
+        self.binary_clients.discard(websocket)
+        stream = self.audio_streams.pop(websocket, None)
+        if stream:
+            stream.worker.cancel()
+        session = self.client_sessions.pop(websocket, None)
+        if session:
+            self.sessions.detach(session)
+            if self.scheduler and session.connections == 0:
+                # Nobody is left to read the reply: drop queued work and stop running decodes
+                self.scheduler.cancel(session.session_id)
         logger.info(f"Client disconnected: {websocket.remote_address}")
 
+    def requested_session_id(self, websocket) -> Optional[str]:
+        """Read a client-supplied ?session_id=... from the connection URL"""
+        request = getattr(websocket, "request", None)
+        path = getattr(request, "path", None) or getattr(websocket, "path", "") or ""
+        values = parse_qs(urlparse(path).query).get("session_id")
+        return values[0] if values else None
+
+    def session_ai(self, websocket) -> AIPersonality:
+        session = self.client_sessions[websocket]
+        self.sessions.touch(session)
+        return session.ai
+
+    async def resume_session(self, websocket, message_data):
+        """Switch this connection to a previously issued session id"""
+        session_id = message_data.get("session_id")
+        if not session_id:
+            await self.send_message(websocket, "error", "session_id is required")
+            return
+
+        previous = self.client_sessions.get(websocket)
+        if previous and previous.session_id == session_id:
+            session = previous
+        else:
+            session = await self.sessions.attach(session_id)
+            self.client_sessions[websocket] = session
+            if previous:
+                self.sessions.detach(previous)
+
+        await self.send_message(
+            websocket,
+            "session",
+            session.session_id,
+            extra_data={"conversation_summary": session.ai.get_conversation_summary()}
+        )
+
+    async def check_requested_model(self, websocket, message_data) -> bool:
+        """Reject a "model" that isn't in the registry before anything is transcribed or queued"""
+        model_name = message_data.get("model") or None
+        registry = self.sessions.model_manager.registry if self.sessions.model_manager else {}
+        if model_name is not None and model_name not in registry:
+            await self.send_message(websocket, "error", f"Unknown model: {model_name}",
+                                    extra_data={"available_models": list(registry)})
+            return False
+        return True
+
+    async def select_model(self, websocket, message_data):
+        """Choose which registered model answers this session's messages"""
+        if not await self.check_requested_model(websocket, message_data):
+            return
+
+        model_name = message_data.get("model") or None
+        registry = self.sessions.model_manager.registry if self.sessions.model_manager else {}
+        self.session_ai(websocket).model_name = model_name
+        await self.send_message(websocket, "model_selected", model_name or "default",
+                                extra_data={"available_models": list(registry)})
+
+    async def select_adapter(self, websocket, message_data):
+        """Choose the LoRA personality adapter applied to this session's replies (None = personality default)"""
+        adapter = message_data.get("adapter") or None
+        lora_adapters = self.sessions.lora_adapters
+        available = lora_adapters.names() if lora_adapters is not None else []
+        if adapter is not None and adapter not in available:
+            await self.send_message(websocket, "error", f"Unknown adapter: {adapter}",
+                                    extra_data={"available_adapters": available})
+            return
+
+        ai = self.session_ai(websocket)
+        ai.lora_adapter = adapter
+        await self.send_message(websocket, "adapter_selected", ai.adapter_name() or "base",
+                                extra_data={"available_adapters": available})
+
     async def send_message(self, websocket, message_type: str, content: str, extra_data=None):
         try:
             response_data = {
@@ -41,7 +156,8 @@ class WebSocketServer:
             }
             if extra_data:
                 response_data.update(extra_data)
-            await websocket.send(json.dumps(response_data))
+            with stage_seconds.time(stage="send"):
+                await websocket.send(json.dumps(response_data))
         except websockets.ConnectionClosed:
             logger.warning("Connection closed while sending message")
             await self.unregister_client(websocket)
@@ -50,37 +166,169 @@ class WebSocketServer:
             logger.error(f"Full traceback: {traceback.format_exc()}")
             raise
 
-    async def broadcast_message(self, message_type: str, content: str):
+    async def send_audio(self, websocket, audio_path: str, sequence: int = 0, final: bool = False):
+        """Push TTS audio as a binary frame to clients that negotiated it"""
+        if websocket not in self.binary_clients or not audio_path:
+            return
+
+        def _read():
+            with open(audio_path, "rb") as f:
+                return f.read()
+
+        audio_bytes = await asyncio.get_event_loop().run_in_executor(None, _read)
+        frame = binary_protocol.encode_frame(
+            binary_protocol.FRAME_TTS_AUDIO,
+            audio_bytes,
+            codec=binary_protocol.CODEC_MP3,
+            flags=binary_protocol.FLAG_FINAL if final else 0,
+            sequence=sequence
+        )
+        try:
+            await websocket.send(frame)
+        except websockets.ConnectionClosed:
+            logger.warning("Connection closed while sending audio")
+            await self.unregister_client(websocket)
+
+    async def handle_hello(self, websocket, message_data):
+        """Capability negotiation for binary audio frames"""
+        if message_data.get("binary_audio"):
+            self.binary_clients.add(websocket)
+        else:
+            self.binary_clients.discard(websocket)
+        await self.send_message(
+            websocket,
+            "capabilities",
+            "",
+            extra_data={
+                "binary_audio": websocket in self.binary_clients,
+                "protocol_version": binary_protocol.PROTOCOL_VERSION
+            }
+        )
+
+    async def handle_binary_frame(self, websocket, data: bytes):
+        try:
+            frame = binary_protocol.decode_frame(data)
+        except binary_protocol.ProtocolError as e:
+            await self.send_message(websocket, "error", str(e))
+            return
+
+        if frame.frame_type == binary_protocol.FRAME_AUDIO_CHUNK:
+            await self.handle_audio_chunk(websocket, frame.payload)
+        elif frame.frame_type == binary_protocol.FRAME_AUDIO_UPLOAD:
+            message_data = {"stream": bool(frame.flags & binary_protocol.FLAG_STREAM_REPLY)}
+            await self.process_audio_clip(websocket, bytes(frame.payload), frame.codec_name, message_data)
+        else:
+            logger.warning(f"Unknown binary frame type: {frame.frame_type}")
+
+    def publish_readiness(self):
+        """Broadcast a status message to every client whenever the readiness state changes"""
+        loop = asyncio.get_event_loop()
+
+        def _on_change(status):
+            loop.call_soon_threadsafe(
+                lambda: asyncio.ensure_future(self.broadcast_message("status", status["state"], extra_data=status))
+            )
+
+        readiness.on_change(_on_change)
+
+    async def send_not_ready(self, websocket):
+        status = readiness.to_dict()
+        await self.send_message(websocket, "not_ready", "The AI is still starting up, please wait", extra_data=status)
+
+    async def broadcast_message(self, message_type: str, content: str, extra_data=None):
         if self.connected_clients:
             tasks = [
-                self.send_message(client, message_type, content)
+                self.send_message(client, message_type, content, extra_data=extra_data)
                 for client in self.connected_clients.copy()
             ]
             await asyncio.gather(*tasks, return_exceptions=True)
 
+    def queue_position_notifier(self, websocket):
+        async def notify(position: int):
+            await self.send_message(websocket, "queue_position", f"You are #{position} in line",
+                                    extra_data={"position": position})
+        return notify
+
+    async def stream_ai_response(self, websocket, ai: AIPersonality, user_message: str, message_data,
+                                 on_delta=None) -> str:
+        """Push the reply as ai_response_delta frames while it is generated and return the full text"""
+        parts = []
+        notify = self.queue_position_notifier(websocket)
+        async for delta in ai.generate_response_stream(user_message, on_queue_position=notify,
+                                                       model_name=message_data.get("model")):
+            parts.append(delta)
+            await self.send_message(websocket, "ai_response_delta", delta)
+            if on_delta:
+                await on_delta(delta)
+        return "".join(parts).strip()
+
+    async def synthesize_speech(self, text: str) -> str:
+        return await self.audio.synthesize(text)
+
+    async def respond(self, websocket, ai: AIPersonality, user_message: str, message_data, include_summary=False):
+        """Generate the reply and its speech, then send the final ai_response_audio frame"""
+        extra_data = {}
+
+        if message_data.get("stream", False):
+            # Speak each sentence as soon as it is complete instead of after the whole reply
+            async def send_segment(index: int, sentence: str, audio_path: str):
+                await self.send_message(
+                    websocket,
+                    "ai_response_audio_segment",
+                    sentence,
+                    extra_data={
+                        "index": index,
+                        "audio_path": audio_path,
+                        "audio_binary": websocket in self.binary_clients
+                    }
+                )
+                await self.send_audio(websocket, audio_path, sequence=index)
+
+            pipeline = SpeechPipeline(self.synthesize_speech, send_segment)
+            try:
+                ai_response = await self.stream_ai_response(websocket, ai, user_message, message_data,
+                                                            on_delta=pipeline.feed)
+                extra_data["audio_segments"] = await pipeline.finish()
+            except BaseException:
+                pipeline.cancel()
+                raise
+            extra_data["audio_path"] = None
+        else:
+            ai_response = await ai.generate_response(
+                user_message,
+                on_queue_position=self.queue_position_notifier(websocket),
+                model_name=message_data.get("model")
+            )
+            extra_data["audio_path"] = await self.synthesize_speech(ai_response)
+
+        if include_summary:
+            extra_data["conversation_summary"] = ai.get_conversation_summary()
+            extra_data["response_time"] = time.time()
+
+        extra_data["audio_binary"] = websocket in self.binary_clients and bool(extra_data["audio_path"])
+        await self.send_message(websocket, "ai_response_audio", ai_response, extra_data=extra_data)
+        await self.send_audio(websocket, extra_data["audio_path"], final=True)
+
     async def handle_user_message(self, websocket, message_data):
         try:
             user_message = message_data.get("content", "").strip()
             if not user_message:
                 await self.send_message(websocket, "error", "Message cannot be empty")
                 return
+            if not await self.check_requested_model(websocket, message_data):
+                return
 
             await self.send_message(websocket, "typing", "AI is typing...")
 
-            ai_response = await self.ai.generate_response(user_message)
-            audio_path = text_to_speech(ai_response)
-
-            await self.send_message(
-                websocket,
-                "ai_response_audio",
-                ai_response,
-                extra_data={
-                    "audio_path": audio_path,
-                    "conversation_summary": self.ai.get_conversation_summary(),
-                    "response_time": time.time()
-                }
-            )
+            with stage_seconds.time(stage="turn"):
+                await self.respond(websocket, self.session_ai(websocket), user_message, message_data,
+                                   include_summary=True)
 
+        except SchedulerBusy as e:
+            logger.warning(f"Rejected message, inference queue full: {e}")
+            await self.send_message(websocket, "busy", "The AI is busy right now, please try again shortly")
+        except GenerationCancelled:
+            logger.info("Dropped a reply for a session with no connected clients")
         except Exception as e:
             logger.error(f"Error in handle_user_message: {e}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
@@ -88,28 +336,62 @@ class WebSocketServer:
 
     async def handle_client_connection(self, websocket):
         try:
-            await self.register_client(websocket)
+            await self.register_client(websocket, self.requested_session_id(websocket))
+            session = self.client_sessions[websocket]
+            welcome = f"Connected to {session.ai.personality_config['name']}!"
             await self.send_message(
                 websocket,
                 "welcome",
-                f"Connected to {self.ai.personality_config['name']}!",
-                extra_data={"ai_personality": self.ai.personality_config["traits"]}
+                welcome,
+                extra_data={
+                    "ai_personality": session.ai.personality_config["traits"],
+                    "session_id": session.session_id,
+                    "status": readiness.to_dict(),
+                    # Only spoken when prewarmed; never synthesized on the connect path
+                    "audio_path": get_cache().lookup(welcome)
+                }
             )
 
             async for raw_message in websocket:
                 try:
-                    parsed_data = json.loads(raw_message)
+                    if isinstance(raw_message, bytes):
+                        if not readiness.is_ready:
+                            await self.send_not_ready(websocket)
+                        else:
+                            await self.handle_binary_frame(websocket, raw_message)
+                        continue
+
+                    with stage_seconds.time(stage="json_parse"):
+                        parsed_data = json.loads(raw_message)
                     msg_type = parsed_data.get("type", "user_message")
 
+                    if msg_type in self.MODEL_MESSAGE_TYPES and not readiness.is_ready:
+                        await self.send_not_ready(websocket)
+                        continue
+
                     if msg_type == 'user_message':
                         await self.handle_user_message(websocket, parsed_data)
+                    elif msg_type == "hello":
+                        await self.handle_hello(websocket, parsed_data)
                     elif msg_type == 'ping':
                         await self.send_message(websocket, "pong", "alive")
                     elif msg_type == "get_conversation_summary":
-                        summary = self.ai.get_conversation_summary()
+                        summary = self.session_ai(websocket).get_conversation_summary()
                         await self.send_message(websocket, "conversation_summary", "", extra_data=summary)
+                    elif msg_type == "select_model":
+                        await self.select_model(websocket, parsed_data)
+                    elif msg_type == "select_adapter":
+                        await self.select_adapter(websocket, parsed_data)
+                    elif msg_type == "resume_session":
+                        await self.resume_session(websocket, parsed_data)
                     elif msg_type == "audio_input":
                         await self.handle_audio_input(websocket, parsed_data)
+                    elif msg_type == "audio_stream_start":
+                        await self.handle_audio_stream_start(websocket, parsed_data)
+                    elif msg_type == "audio_chunk":
+                        await self.handle_audio_chunk(websocket, base64.b64decode(parsed_data.get("audio_data", "")))
+                    elif msg_type == "audio_stream_end":
+                        await self.handle_audio_stream_end(websocket)
                     else:
                         logger.warning(f"Unknown message type: {msg_type}")
 
@@ -130,39 +412,51 @@ class WebSocketServer:
             await self.unregister_client(websocket)
 
     async def handle_audio_input(self, websocket, message_data):
+        audio_data = message_data.get("audio_data")
+        if not audio_data:
+            await self.send_message(websocket, "error", "Audio data is empty")
+            return
+
+        await self.process_audio_clip(
+            websocket,
+            base64.b64decode(audio_data),
+            message_data.get("format", "wav"),
+            message_data
+        )
+
+    async def process_audio_clip(self, websocket, audio_bytes: bytes, audio_format: str, message_data):
+        """Transcribe a complete recorded clip and answer it"""
         temp_filename = None
         try:
-            audio_data = message_data.get("audio_data")
-            audio_format = message_data.get("format", "wav")
-
-            if not audio_data:
+            if not audio_bytes:
                 await self.send_message(websocket, "error", "Audio data is empty")
                 return
+            if not await self.check_requested_model(websocket, message_data):
+                return
 
-            import base64, uuid
-            audio_bytes = base64.b64decode(audio_data)
+            import uuid
             temp_filename = f"temp_audio_{uuid.uuid4().hex}.{audio_format}"
 
             with open(temp_filename, "wb") as f:
                 f.write(audio_bytes)
 
             await self.send_message(websocket, "typing", "AI is processing audio input...")
-            user_text = transcribe_audio(temp_filename)
+            user_text = await self.audio.transcribe(temp_filename)
 
             if not user_text.strip():
                 await self.send_message(websocket, "error", "Could not transcribe audio")
                 return
 
-            ai_response = await self.ai.generate_response(user_text)
-            audio_path = text_to_speech(ai_response)
-
-            await self.send_message(
-                websocket,
-                "ai_response_audio",
-                ai_response,
-                extra_data={"audio_path": audio_path}
-            )
+            await self.respond(websocket, self.session_ai(websocket), user_text, message_data)
 
+        except SchedulerBusy as e:
+            logger.warning(f"Rejected audio input, inference queue full: {e}")
+            await self.send_message(websocket, "busy", "The AI is busy right now, please try again shortly")
+        except GenerationCancelled:
+            logger.info("Dropped a reply for a session with no connected clients")
+        except asyncio.TimeoutError:
+            logger.error("Audio processing timed out")
+            await self.send_message(websocket, "error", "Audio processing timed out")
         except Exception as e:
             logger.error(f"Error processing audio input: {e}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
@@ -175,6 +469,75 @@ class WebSocketServer:
                 except Exception as e:
                     logger.warning(f"Failed to remove temporary file {temp_filename}: {e}")
 
+    async def handle_audio_stream_start(self, websocket, message_data):
+        """Begin a live audio stream; utterances are transcribed as soon as VAD closes them"""
+        await self.handle_audio_stream_end(websocket)
+        if not await self.check_requested_model(websocket, message_data):
+            return
+
+        utterances: asyncio.Queue = asyncio.Queue()
+        self.audio_streams[websocket] = AudioStream(
+            input=StreamingTranscriptionInput(
+                sample_rate=int(message_data.get("sample_rate", 16000)),
+                encoding=message_data.get("encoding", "pcm_s16le")
+            ),
+            utterances=utterances,
+            worker=asyncio.create_task(self.process_utterances(websocket, utterances, message_data))
+        )
+        await self.send_message(websocket, "audio_stream_ready", "Listening...")
+
+    async def handle_audio_chunk(self, websocket, audio_bytes: bytes):
+        stream = self.audio_streams.get(websocket)
+        if stream is None:
+            await self.send_message(websocket, "error", "No audio stream started")
+            return
+        # Segmentation is cheap; transcription and replies run on the stream's worker task
+        for samples in stream.input.feed(audio_bytes):
+            stream.utterances.put_nowait(samples)
+
+    async def handle_audio_stream_end(self, websocket):
+        stream = self.audio_streams.pop(websocket, None)
+        if stream is None:
+            return
+        for samples in stream.input.finish():
+            stream.utterances.put_nowait(samples)
+        stream.utterances.put_nowait(None)
+
+    async def process_utterances(self, websocket, utterances: asyncio.Queue, message_data):
+        while True:
+            samples = await utterances.get()
+            if samples is None:
+                return
+            try:
+                user_text = (await self.audio.transcribe_samples(samples)).strip()
+                if not user_text:
+                    continue
+                await self.send_message(websocket, "transcript", user_text)
+                await self.respond(websocket, self.session_ai(websocket), user_text, message_data)
+            except SchedulerBusy:
+                await self.send_message(websocket, "busy", "The AI is busy right now, please try again shortly")
+            except GenerationCancelled:
+                logger.info("Dropped a reply for a session with no connected clients")
+            except asyncio.TimeoutError:
+                await self.send_message(websocket, "error", "Audio processing timed out")
+            except Exception as e:
+                logger.error(f"Error processing streamed utterance: {e}")
+                logger.error(f"Full traceback: {traceback.format_exc()}")
+                await self.send_message(websocket, "error", f"Audio processing error: {str(e)}")
+
+    def register_metrics(self):
+        metrics.gauge("anya_connected_clients", "Open WebSocket connections",
+                      function=lambda: len(self.connected_clients))
+        metrics.gauge("anya_sessions", "Conversation sessions held in memory",
+                      function=lambda: self.sessions.stats()["sessions"])
+        metrics.gauge("anya_session_memory_bytes", "Approximate bytes held by conversation histories",
+                      function=self.sessions.total_memory)
+        if self.scheduler is not None:
+            metrics.gauge("anya_inference_queue_depth", "Generations waiting for the model",
+                          function=lambda: self.scheduler.queue_depth)
+            metrics.gauge("anya_inference_in_flight", "Generations currently running",
+                          function=lambda: self.scheduler.in_flight)
+
     async def start_server(self):
         logger.info(f"Starting WebSocket server on {self.host}:{self.port}")
         server = await websockets.serve(
@@ -188,25 +551,167 @@ class WebSocketServer:
         logger.info(f"WebSocket server started on ws://{self.host}:{self.port}")
         return server
 
-async def run_ai_server():
-    logger.info("Initializing AI Model...")
+async def warm_up_models(manager: ModelManager, session_manager: SessionManager, audio_workers: AudioWorkers,
+                         n_parallel: int, speculative: bool = False):
+    """Load and exercise the models in the background while the sockets are already open"""
+    loop = asyncio.get_event_loop()
     try:
-        manager = ModelManager()
-        model_path = "models/Qwen2.5-14B-Instruct-IQ2_M.gguf"
+        readiness.set_state(LOADING_MODEL, "Loading language model")
+        model_path = DEFAULT_MODEL_PATH
         if not os.path.exists(model_path):
-            model_path = manager.download_model()
+            model_path = await loop.run_in_executor(None, manager.download_model)
 
         # FIX: only one object is returned
-        model = manager.load_model(model_path)
+        model = await loop.run_in_executor(None, partial(manager.load_model, model_path, speculative=speculative))
+        # With continuous batching every in-flight request is one sequence in the shared decode loop
+        engine = manager.get_batched_engine(n_parallel=n_parallel) if n_parallel > 1 else None
+
+        readiness.set_state(WARMING_UP, "Warming up models")
+        await loop.run_in_executor(None, manager.warmup)
+        try:
+            await asyncio.gather(*[asyncio.wrap_future(f) for f in audio_workers.warmup()])
+        except Exception as e:
+            # Text chat still works without speech input
+            logger.error(f"Speech-to-text warmup failed: {e}")
 
-        ai_personality = AIPersonality(model,tokenizer=manager.tokenizer)
-        server = WebSocketServer(ai_personality)
+        session_manager.attach_model(model, tokenizer=manager.tokenizer, engine=engine)
+        readiness.set_state(READY)
+        logger.info(f"AI ready after {readiness.to_dict()['startup_seconds']:.1f}s")
+
+    except Exception as e:
+        logger.error(f"Error warming up models: {e}")
+        logger.error(f"Full traceback: {traceback.format_exc()}")
+        readiness.set_state(FAILED, "Model loading failed", error=str(e))
+
+def register_runtime_metrics(manager: ModelManager, state_cache: SessionStateCache, tts_cache,
+                             response_cache: Optional[ResponseCache] = None,
+                             lora_adapters: Optional[LoRAAdapterManager] = None):
+    """Scrape-time views of caches and model memory; nothing is recorded on the hot path"""
+    def cache_requests():
+        requests = {
+            ("kv_state", "hit"): state_cache.hits,
+            ("kv_state", "miss"): state_cache.misses,
+            ("tts", "hit"): tts_cache.hits,
+            ("tts", "miss"): tts_cache.misses,
+        }
+        if response_cache is not None:
+            requests[("response", "hit")] = response_cache.hits
+            requests[("response", "miss")] = response_cache.misses
+        return requests
+
+    def model_memory():
+        return {(entry.name,): entry.size_bytes for entry in list(manager.registry.values()) if entry.model is not None}
+
+    def engine_throughput():
+        engine = manager.batched_engine
+        return engine.stats()["tokens_per_second"] if engine is not None else 0
+
+    metrics.counter("anya_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"],
+                    function=cache_requests)
+    metrics.gauge("anya_kv_cache_bytes", "Bytes of saved llama.cpp session states",
+                  function=lambda: state_cache.size_bytes)
+    metrics.gauge("anya_tts_cache_bytes", "Bytes of cached synthesized speech", function=lambda: tts_cache.size_bytes)
+    metrics.gauge("anya_model_memory_bytes", "GGUF bytes of loaded models", ["model"], function=model_memory)
+    metrics.gauge("anya_batched_engine_tokens_per_second", "Average batched engine throughput since start",
+                  function=engine_throughput)
+    metrics.gauge("anya_speculative_acceptance_rate", "Share of drafted tokens the main model accepted", ["draft"],
+                  function=lambda: {(s["draft"],): s["acceptance_rate"] for s in speculative_stats()})
+    metrics.gauge("anya_speculative_tokens_per_pass", "Tokens generated per main-model decode pass (1 without drafts)",
+                  ["draft"], function=lambda: {(s["draft"],): s["tokens_per_pass"] for s in speculative_stats()})
+    if lora_adapters is not None:
+        metrics.gauge("anya_lora_adapters_loaded", "LoRA adapters loaded onto base models",
+                      function=lambda: lora_adapters.stats()["loaded"])
+        metrics.counter("anya_lora_adapter_switches_total", "Adapter changes on a model context",
+                        function=lambda: lora_adapters.switches)
+
+
+async def run_ai_server():
+    logger.info("Initializing AI server...")
+    try:
+        manager = ModelManager()
+        n_parallel = int(os.environ.get("ANYA_BATCH_PARALLEL", 1))
+
+        state_cache = SessionStateCache(capacity_bytes=int(os.environ.get("ANYA_KV_CACHE_BYTES", 2 << 30)))
+        if n_parallel <= 1 and int(os.environ.get("ANYA_MAX_IN_FLIGHT", 1)) > 1:
+            logger.warning("ANYA_MAX_IN_FLIGHT needs the batched engine (ANYA_BATCH_PARALLEL>1); running one at a time")
+        scheduler = InferenceScheduler(
+            # Without the engine every generation needs the model's single context
+            max_in_flight=n_parallel if n_parallel > 1 else 1,
+            max_queue=int(os.environ.get("ANYA_MAX_QUEUE", 64))
+        )
+        # The model is attached once warmup finishes
+        # Extra models (e.g. a small one for chit-chat) are loaded on demand within the RAM budget
+        models_config = os.environ.get("ANYA_MODELS_CONFIG", "models.json")
+        if os.path.exists(models_config):
+            manager.register_models_from_file(models_config)
+
+        # Replies to repeated small talk ("Hey", "Tell me a joke") served without running the model
+        response_cache = None
+        if os.environ.get("ANYA_RESPONSE_CACHE", "0") == "1":
+            response_cache = ResponseCache(
+                max_entries=int(os.environ.get("ANYA_RESPONSE_CACHE_ENTRIES", 2048)),
+                ttl=float(os.environ.get("ANYA_RESPONSE_CACHE_TTL", 6 * 3600)),
+                variety=int(os.environ.get("ANYA_RESPONSE_CACHE_VARIETY", 3))
+            )
+
+        # Past exchanges recalled into prompts; sessions are remembered by their (client-persisted) id
+        long_term_memory = None
+        if os.environ.get("ANYA_LONG_TERM_MEMORY", "0") == "1":
+            long_term_memory = LongTermMemory(os.environ.get("ANYA_MEMORY_DIR", "memory_store"))
+
+        # Conversations survive restarts and evictions; set ANYA_CONVERSATION_DB="" to keep them in memory only
+        conversation_db = os.environ.get("ANYA_CONVERSATION_DB", "conversations.db")
+        conversation_store = ConversationStore(conversation_db) if conversation_db else None
+
+        # Speculative decoding: "prompt_lookup", or the registry name / GGUF path of a small draft model
+        # sharing the main model's vocabulary. Personalities can also set their own "speculative" config.
+        speculative_draft = os.environ.get("ANYA_SPECULATIVE_DRAFT")
+        personality_config = None
+        if speculative_draft:
+            personality_config = AIPersonality(None).personality_config
+            personality_config["speculative"] = (
+                {"draft": DRAFT_PROMPT_LOOKUP} if speculative_draft == DRAFT_PROMPT_LOOKUP
+                else {"draft": DRAFT_MODEL, "model": speculative_draft}
+            )
+
+        # LoRA personality adapters (<name>.gguf, see lora_adapters.py) share the loaded base model
+        adapter_dir = os.environ.get("ANYA_ADAPTER_DIR", "adapters")
+        lora_adapters = LoRAAdapterManager(adapter_dir) if os.path.isdir(adapter_dir) else None
+
+        session_manager = SessionManager(None, personality_config=personality_config,
+                                         state_cache=state_cache, scheduler=scheduler,
+                                         model_manager=manager, response_cache=response_cache,
+                                         long_term_memory=long_term_memory, conversation_store=conversation_store,
+                                         # Fold old turns into a rolling summary between turns, optionally
+                                         # with a smaller registry model
+                                         summarize=os.environ.get("ANYA_SUMMARIZE", "0") == "1",
+                                         summary_model=os.environ.get("ANYA_SUMMARY_MODEL") or None,
+                                         lora_adapters=lora_adapters)
+        session_manager.start_eviction()
+
+        tts_cache = get_cache()
+        tts_cache.start_janitor()
+        personality_config = session_manager.personality_config or AIPersonality(None).personality_config
+        welcome_line = f"Connected to {personality_config['name']}!"
+        asyncio.get_event_loop().run_in_executor(None, tts_cache.prewarm, [welcome_line])
+        audio_workers = AudioWorkers(
+            stt_workers=int(os.environ.get("ANYA_STT_WORKERS", 1)),
+            tts_workers=int(os.environ.get("ANYA_TTS_WORKERS", 4))
+        )
+        server = WebSocketServer(session_manager, scheduler=scheduler, audio_workers=audio_workers)
+        server.register_metrics()
+        register_runtime_metrics(manager, state_cache, tts_cache, response_cache, lora_adapters)
         websocket_server = await server.start_server()
+        server.publish_readiness()
+
+        warmup = asyncio.create_task(warm_up_models(manager, session_manager, audio_workers, n_parallel,
+                                                    speculative=bool(speculative_draft)))
 
         try:
             await websocket_server.wait_closed()
         except KeyboardInterrupt:
             logger.info("Shutting down WebSocket server...")
+            warmup.cancel()
             websocket_server.close()
             await websocket_server.wait_closed()
 